@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+
+# compile the noun lemmas of WordNet into the table that topics.py lemmatizes with;
+# WordNet is only needed to run this, once: python build-lemma-table.py
+
+from topics import LemmaTable, LEMMA_TABLE_PATH, wordnet_noun_lemmas
+
+LemmaTable.write(LEMMA_TABLE_PATH, wordnet_noun_lemmas())
+print("{} lemmas written to {}".format(len(LemmaTable(LEMMA_TABLE_PATH)), LEMMA_TABLE_PATH))
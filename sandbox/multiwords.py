@@ -0,0 +1,43 @@
+# compare merging multiwords with NLTK's MWETokenizer and then removing stopwords 
+# from a list, with MultiwordTokenizer doing both in one pass; run from the root:
+# python sandbox/multiwords.py data/abstracts.csv
+
+import os
+import sys
+import time
+import itertools
+import collections
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from nltk.tokenize import MWETokenizer
+from topics import MultiwordTokenizer, tokenize_text, lemmatize_word, read_stopword_file
+
+def benchmark(name, preprocess, documents, repeat=5):
+	start = time.perf_counter()
+	for _ in range(repeat):
+		tokens = [preprocess(document) for document in documents]
+	print("{:<40} {:8.3f}s".format(name, (time.perf_counter() - start) / repeat))
+	return tokens
+
+documents = pd.read_csv(sys.argv[1] if len(sys.argv) > 1 else "data/abstracts.csv")["content"]
+documents = [[lemmatize_word(word) for word in tokenize_text(document)] for document in documents]
+stopwords = list(read_stopword_file("stopwords-en.txt"))
+stopword_set = set(stopwords)
+
+# the most frequent bigrams and trigrams of the corpus are used as multiwords
+ngrams = collections.Counter(itertools.chain.from_iterable(
+	zip(*[document[i:] for i in range(n)]) for document in documents for n in (2, 3)))
+for number_of_multiwords in [10, 1000, 5000]:
+	multiwords = [list(ngram) for ngram, _ in ngrams.most_common(number_of_multiwords)]
+	print("{} documents, {} multiwords, {} stopwords".format(len(documents), len(multiwords), len(stopwords)))
+	mwe_tokenizer = MWETokenizer(multiwords)
+	multiword_tokenizer = MultiwordTokenizer(multiwords)
+	expected = benchmark("MWETokenizer, stopword list", lambda document: 
+		[word for word in mwe_tokenizer.tokenize(document) if word not in stopwords], documents)
+	benchmark("MWETokenizer, stopword set", lambda document: 
+		[word for word in mwe_tokenizer.tokenize(document) if word not in stopword_set], documents)
+	actual = benchmark("MultiwordTokenizer, one pass", lambda document: 
+		multiword_tokenizer.tokenize(document, stopword_set), documents)
+	assert actual == expected
@@ -34,6 +34,11 @@ def topics(model):
 	return pd.DataFrame([[" ".join([tw[0] for tw in model.lda.show_topic(t, 10)])] 
 		for t in range(number_of_topics)])
 
+# the topics of the documents are inferred once per model and corpus, and shared
+# by all views; the matrix is read-only
+def document_topics(model, corpus):
+	return model.document_topics(corpus)
+
 def document_topic_matrix(model, corpus):
 	return model.document_topic_matrix(corpus)
 
@@ -43,7 +48,7 @@ def tally_columns(dtm, number_of_topics):
 	return [sum([row[k] for row in dtm])/len(dtm) for k in range(number_of_topics)]
 
 def topic_coocurrence_graph(model, corpus, number_of_topics, min_weight, min_edges):
-	dtm = document_topic_matrix(model, corpus).to_numpy()
+	dtm = document_topics(model, corpus)
 	keywords = ["\n".join([tw[0] for tw in model.lda.show_topic(t, 3)])
 		for t in range(number_of_topics)]
 	graph = graphviz.Graph()
@@ -64,7 +69,7 @@ def topic_coocurrence_graph(model, corpus, number_of_topics, min_weight, min_edg
 	return graph
 
 def topic_coocurrence_graph_pyvis(model, corpus, number_of_topics, min_weight, min_edges, smooth_edges):
-	dtm = document_topic_matrix(model, corpus).to_numpy()
+	dtm = document_topics(model, corpus)
 	keywords = ["\n" + "\n".join([tw[0] for tw in model.lda.show_topic(t, 3)])
 		for t in range(number_of_topics)]
 	# graph = Network("600px", "100%", notebook=True, heading='')
@@ -103,7 +108,7 @@ def topic_coocurrence_graph_pyvis(model, corpus, number_of_topics, min_weight, m
 
 def keyword_coocurrence_graph(model, corpus, selected_topic, min_edges, cut_off):
 	# step 1: select most relevant documents for the selected topic
-	dtm = document_topic_matrix(model, corpus).to_numpy()
+	dtm = document_topics(model, corpus)
 	top_documents = sort_by_topic(dtm, selected_topic, cut_off)
 	documents = corpus.documents['content'][top_documents]
 
@@ -118,8 +123,7 @@ def keyword_coocurrence_graph(model, corpus, selected_topic, min_edges, cut_off)
 			# sentence = re.sub(r'[^A-Za-z0-9]+', ' ', sentence)
 			# words = [word for word in sentence.lower().split(" ") 
 			# 	if word not in corpus.stopwords]
-			words = [word for word in corpus.tokenizer.tokenize([corpus.lemmatize(word) for word in corpus.tokenize(sentence)])
-				if word not in corpus.stopwords]
+			words = corpus.preprocess_document(sentence)
 			words = set(words)
 			for word in words:
 				if word not in index:
@@ -191,7 +195,7 @@ def sort_by_topic(dtm, k, cut_off=0.80):
 		if dtm[index][k] >= cut_off]
 
 def sort_topics(model, corpus):
-	dtm = document_topic_matrix(model, corpus).to_numpy()
+	dtm = document_topics(model, corpus)
 	total_topic_weights = tally_columns(dtm, number_of_topics)
 	top_topics = np.argsort(-np.array(total_topic_weights))
 	return top_topics
@@ -348,7 +352,7 @@ def show_documents_associated_with_topic(corpus, number_of_topics, number_of_chu
 			selected_topic = topic_order[selected_topic]
 		show_topic_info(corpus, number_of_topics, number_of_chunks, selected_topic)
 		keywords = topic_keywords(model, selected_topic, number_of_keywords=25)
-		dtm = document_topic_matrix(model, corpus).to_numpy()
+		dtm = document_topics(model, corpus)
 		top_documents = sort_by_topic(dtm, selected_topic, min_topic_weight)
 		top_documents_df = pd.DataFrame(corpus.documents).iloc[top_documents]
 		for i, row in top_documents_df.iterrows():
@@ -397,7 +401,7 @@ def download_link(dataframe, file_name, title="Download"):
 def show_topic_info(corpus, number_of_topics, number_of_chunks, selected_topic):
 	model = topic_model(corpus, number_of_topics, number_of_chunks)
 	topic_keywords = ", ".join([tw[0] for tw in model.lda.show_topic(selected_topic, 3)])
-	dtm = document_topic_matrix(model, corpus).to_numpy()
+	dtm = document_topics(model, corpus)
 	total_topic_weights = tally_columns(dtm, number_of_topics)
 	st.markdown("  ")
 	st.markdown("Keyword co-occurrences for topic **{}** ({}) with weight **{weight:.2f}**".format(
@@ -425,8 +429,7 @@ def annotated_document_v2(corpus, document, keywords):
 		else:
 			return word
 	words_and_punctuation = re.findall(r'\w+|\W+', document)
-	words = [word for word in corpus.tokenizer.tokenize([corpus.lemmatize(word) for word in corpus.tokenize(document)])]	
-	words = [annotate_word(word) for word in words]
+	words = [annotate_word(word) for word in corpus.lemmatize_document(document)]
 	return " ".join(words)
 	# return " ".join([word if word in keywords else words_and_punctuation[i] for i, word in enumerate(words)])
 	# annotated_words = []
@@ -1,22 +1,21 @@
 import streamlit as st
 import numpy as np 
 import pandas as pd 
-from scipy.optimize import linear_sum_assignment
 import time
 import base64
+import os
 
 from topics import TopicModel
 from topics import TopicAlignment
-
-from gensim import utils
+from topics import Corpus
+from topics import TokenCache
+from topics import ModelCache
+from topics import TRAINING_ENGINES
 
 import math
 
 # model
 
-# Added a random seed for reproducibility (if unchecked, no seed will be used)
-random_seed = None
-
 # Keep track whether the topic model needs to be updated
 if 'is_dirty_alignment' not in st.session_state:
 	print(">>> init: set is_dirty to true")
@@ -27,9 +26,19 @@ if 'file_name' not in st.session_state:
 	print(">>> init: set file_name to None")
 	st.session_state.file_name = None
 
+# stopwords are removed from the lemmatized corpus, so that editing them does 
+# not preprocess the corpus again
 @st.cache(allow_output_mutation=True)
-def load_corpus(file, stopwords, multiwords):
-	return tm.load_corpus(file, stopwords, multiwords)
+def load_corpus(file, multiwords, number_of_workers, streaming, phrases):
+	return tm.load_corpus(file, "", multiwords, number_of_workers, token_cache, streaming, 
+		serialized=streaming, phrases=phrases)
+
+@st.cache(hash_funcs={Corpus: id}, allow_output_mutation=True)
+def filter_corpus(corpus, stopwords, min_document_frequency, max_document_frequency, max_vocabulary_size):
+	if corpus is None:
+		return None
+	return corpus.with_vocabulary(stopwords, min_document_frequency, max_document_frequency,
+		max_vocabulary_size)
 
 # instead of caching use dirty flag to recompute topic model as necessary
 # @st.cache(suppress_st_warning=True)
@@ -37,15 +46,28 @@ def load_corpus(file, stopwords, multiwords):
 # @st.cache(hash_funcs = { TopicAlignment: id })
 def find_topic_alignment(corpus, number_of_topics, number_of_chunks, number_of_runs):
 	print(">>> find topic alignment: check is_dirty = {}".format(st.session_state.is_dirty_alignment))
-	if not st.session_state.is_dirty_alignment:
+	if not st.session_state.is_dirty_alignment and st.session_state.alignment.number_of_runs == number_of_runs:
 		print(">>> find topic alignment: return existing topic model")
 		return st.session_state.alignment
-	print(">>> find topic alignment: recompute topic model")
 	status = st.markdown("Fitting topic models:")
 	progress_bar = st.progress(0)
 	def progress_update(run):
 		progress_bar.progress(math.ceil(100 * (run + 1)/number_of_runs))
-	st.session_state.alignment = TopicAlignment(tm, corpus, number_of_topics, number_of_chunks, number_of_runs, random_seed=random_seed)
+	# only the added runs are fitted when the number of runs changes
+	if not st.session_state.is_dirty_alignment:
+		print(">>> find topic alignment: change the number of runs to {}".format(number_of_runs))
+		# the number of parallel runs can change without making the alignment dirty
+		st.session_state.alignment.number_of_processes = st.session_state.number_of_processes
+		st.session_state.alignment.set_number_of_runs(number_of_runs, progress_update)
+		hide_status_indicators(status, progress_bar)
+		return st.session_state.alignment
+	print(">>> find topic alignment: recompute topic model")
+	# Added a random seed for reproducibility (if unchecked, no seed will be used)
+	random_seed = st.session_state.random_seed if st.session_state.use_random_seed else None
+	st.session_state.alignment = TopicAlignment(tm, corpus, number_of_topics, number_of_chunks, number_of_runs, random_seed=random_seed,
+		engine=st.session_state.engine, number_of_workers=st.session_state.number_of_training_workers,
+		number_of_processes=st.session_state.number_of_processes, model_cache=model_cache,
+		sparse=st.session_state.sparse_dtm, consensus=st.session_state.consensus)
 	st.session_state.alignment.fit(progress_update)
 	hide_status_indicators(status, progress_bar)
 	print(">>> find topic alignment: set dirty to false")
@@ -69,6 +91,10 @@ def update_multiwords():
 	print(">>> update update_multiwords: set is_dirty to true")
 	st.session_state.is_dirty_alignment = True
 
+def update_vocabulary():
+	print(">>> update vocabulary: set is_dirty to true")
+	st.session_state.is_dirty_alignment = True
+
 def update_number_of_topics():
 	print(">>> update_number_of_topics: set is_dirty to true")
 	st.session_state.is_dirty_alignment = True
@@ -77,8 +103,20 @@ def update_number_of_chunks():
 	print(">>> update_number_of_chunks: set is_dirty to true")
 	st.session_state.is_dirty_alignment = True
 
-def update_number_of_runs():
-	print(">>> update_number_of_runs: set is_dirty to true")
+def update_random_seed():
+	print(">>> update_random_seed: set is_dirty to true")
+	st.session_state.is_dirty_alignment = True
+
+def update_engine():
+	print(">>> update_engine: set is_dirty to true")
+	st.session_state.is_dirty_alignment = True
+
+def update_sparse_dtm():
+	print(">>> update_sparse_dtm: set is_dirty to true")
+	st.session_state.is_dirty_alignment = True
+
+def update_consensus():
+	print(">>> update_consensus: set is_dirty to true")
 	st.session_state.is_dirty_alignment = True
 
 def update_selected_topic():
@@ -89,14 +127,17 @@ def update_selected_topic():
 def show_documents(corpus):
 	st.header("Documents")
 	if corpus is not None:
-		check_for_name_content_columns(corpus.documents)
+		check_for_name_content_columns(corpus.document_frame([]))
 		st.dataframe(corpus.documents)
+		if corpus.phrases is not None:
+			st.markdown("Detected phrases: {}".format(", ".join(corpus.detected_phrases())))
 		download_link_from_csv("\n".join(corpus.stopwords), "stopwords.txt",
 			"Download stopwords")
 	else:
 		st.markdown("Please upload a corpus.")
 
 def show_documents_bow(corpus):
+		from gensim import utils
 		st.markdown("Bag-of-words representation of the documents:")
 		tcid = utils.revdict(corpus.dictionary.token2id)
 		st.dataframe([[(tcid[t], w) for (t, w) in doc] for doc in corpus.bow()])
@@ -126,15 +167,27 @@ def show_topic_model_runs(corpus, number_of_topics, number_of_chunks, number_of_
 				"tm-{}-runs.csv".format(number_of_topics), 
 				"Download topic model runs")
 			"""
+			The topics are numbered as the topics of the reference run. The stability of a topic is the 
+			average similarity (1 - difference) of the topic with its matching topics in the other runs. 
+			Its agreement is the share of pairs of other runs in which the matching topics also match each other.
+			"""
+			st.markdown("Reference run: **{}**".format(alignment.reference))
+			topic_stability = pd.DataFrame({"stability": alignment.stability, "agreement": alignment.agreement})
+			st.table(topic_stability)
+			download_link_from_csv(topic_stability.to_csv(index_label="topic"),
+				"tm-{}-stability.csv".format(number_of_topics),
+				"Download topic stability")
+			"""
 			## Topics of a new document
 			This is an experimental feature to find the topics a new document belongs to.
 
 			Copy the text of a document you want to classify.
 
-			Topic numbers refer to the first topic model run, unless a different run is selected below.
+			Topic numbers refer to the reference run, unless a different run is selected below.
 			"""
 			new_document = st.text_area("New document")
-			reference_topic_model = st.selectbox("Use this run as the reference topic model", range(number_of_runs), 0)
+			reference_topic_model = st.selectbox("Use this run as the reference topic model", range(number_of_runs), 
+				alignment.reference)
 			if new_document:
 				document_bow = corpus.get_document_bow(new_document)
 				topics = alignment.lda_models[reference_topic_model].get_document_topics(document_bow)
@@ -177,7 +230,7 @@ def show_topic_model_runs(corpus, number_of_topics, number_of_chunks, number_of_
 			documents_to_show = sort_by_average_topic_weight(document_topic_matrix, cut_off=documents_cut_off/100.0)
 			selected_documents = documents_to_show.index.tolist()
 			documents_to_show["name"] = corpus.documents["name"][selected_documents]
-			documents_to_show["content"] = corpus.documents["content"][selected_documents]
+			documents_to_show["content"] = corpus.contents(selected_documents)
 			if "type" in corpus.documents:
 				documents_to_show["type"] = corpus.documents["type"][selected_documents]
 			st.dataframe(documents_to_show)
@@ -259,18 +312,18 @@ def keyword_color(repeated_keywords, num_runs, num_words, keywords, weights):
 
 # implements the rule that in at least x% of the runs the document has to
 # have a weight at or above the cut-off value - for a given topic
+# the weights of the documents for a topic are dense here, even if the runs keep them sparse
 def sort_by_average_topic_weight(documents, cut_off=0.60):
 	num_runs = len(documents.columns)
-	documents_to_show = []
-	documents_to_show_average_weight = []
-	for index, row in documents.iterrows():
-		above_cut_off_weights = [weight for weight in row if weight >= cut_off]
-		if len(above_cut_off_weights) >= 0.75 * num_runs:
-			documents_to_show.append(index)
-			documents_to_show_average_weight.append(np.average(above_cut_off_weights))
-	documents_to_show_index = np.argsort(-np.array(documents_to_show_average_weight))
-	return pd.DataFrame(index=[documents_to_show[i] for i in documents_to_show_index],
-		data=[documents_to_show_average_weight[i] for i in documents_to_show_index], 
+	weights = documents.to_numpy(dtype=np.float32)
+	above_cut_off = weights >= cut_off
+	number_above_cut_off = above_cut_off.sum(axis=1)
+	documents_to_show = np.flatnonzero(number_above_cut_off >= 0.75 * num_runs)
+	documents_to_show_average_weight = (np.where(above_cut_off, weights, 0)[documents_to_show].sum(axis=1) / 
+		number_above_cut_off[documents_to_show])
+	documents_to_show_index = np.argsort(-documents_to_show_average_weight)
+	return pd.DataFrame(index=documents.index[documents_to_show[documents_to_show_index]],
+		data=documents_to_show_average_weight[documents_to_show_index], 
 		columns=["loading"])
 
 def download_link_from_csv(csv, file_name, title="Download"):
@@ -287,23 +340,72 @@ def download_link_from_html(html, file_name, title="Download"):
 
 def app(tm):
 	st.sidebar.title("Topic Model Explorer")
-	file = st.sidebar.file_uploader("Corpus", type="csv", key="new_file", on_change=update_file)
+	file = st.sidebar.file_uploader("Corpus", type=["csv", "parquet", "arrow", "feather"], key="new_file", 
+		on_change=update_file)
 	stopwords = st.sidebar.text_area("Stopwords (one per line)", on_change=update_stopwords)
 	multiwords = st.sidebar.text_area("Multiwords (one per line)", on_change=update_multiwords)
-	corpus = load_corpus(file, stopwords, multiwords)
+	# changing the phrases changes the words, as changing the multiwords does
+	phrases = st.sidebar.checkbox("Detect phrases", value=False, on_change=update_multiwords,
+		help="Merge pairs of words that often occur together, in addition to the multiwords")
+	number_of_workers = st.sidebar.number_input("Number of workers", 1, os.cpu_count(), 1,
+		help="Number of processes used to preprocess the corpus")
+	streaming = st.sidebar.checkbox("Keep documents on disk", value=False,
+		help="Read the corpus in chunks, keep the text of the documents on disk, and stream the " +
+		"bag-of-words corpus from disk when fitting topic models (for large corpora)")
+	st.sidebar.checkbox("Sparse document topic matrix", value=False, key="sparse_dtm", on_change=update_sparse_dtm,
+		help="Keep only the topic weights of documents that are not left out by the minimum probability " +
+		"of the topic models (for large corpora with many topics)")
+	with st.sidebar.expander("Vocabulary"):
+		min_document_frequency = st.number_input("Minimum document frequency", 1, value=1,
+			help="Remove words that occur in fewer documents", on_change=update_vocabulary)
+		max_document_frequency = st.slider("Maximum document frequency", 0.05, 1.0, 1.0, step=0.05,
+			help="Remove words that occur in a larger share of the documents", on_change=update_vocabulary)
+		max_vocabulary_size = st.number_input("Maximum vocabulary size", 0, value=0,
+			help="Only keep this many of the most frequent words (0 keeps all words)", on_change=update_vocabulary)
+	corpus = filter_corpus(load_corpus(file, multiwords, number_of_workers, streaming, phrases), stopwords,
+		min_document_frequency, max_document_frequency, max_vocabulary_size or None)
 	if st.sidebar.checkbox("Show documents"):
 		show_documents(corpus)
+	# settings that remove all words leave nothing to fit topic models to
+	if corpus is not None and corpus.vocabulary_size() == 0:
+		st.markdown("No words are left in the vocabulary; remove some stopwords, or relax the " +
+			"vocabulary settings")
+		corpus = None
 	number_of_topics = st.sidebar.slider("Number of topics", 1, 50, 10, on_change=update_number_of_topics)
 	# Default should be 1. 100 is the value used by Orange. We include this option for compatibility 
 	# with Orange and to examine the impact of this parameter.
 	number_of_chunks = st.sidebar.slider("Number of chunks", 1, 100, 100, on_change=update_number_of_chunks)
-	number_of_runs = st.sidebar.slider("Number of runs", 1, 10, 4, on_change=update_number_of_runs)
-	# if st.sidebar.checkbox("Use random seed (for reproducibility)", value=True):
-	# 	random_seed = st.sidebar.number_input("Random seed", value=42)
+	# runs are added to or dropped from the alignment, so it does not become dirty
+	number_of_runs = st.sidebar.slider("Number of runs", 1, 10, 4)
+	st.sidebar.checkbox("Align runs with a consensus run", value=False, key="consensus", on_change=update_consensus,
+		help="Align the topics of all runs with those of the run that is closest to the other runs, " +
+			"instead of the first run")
+	engine = st.sidebar.selectbox("Training engine", TRAINING_ENGINES, key="engine", on_change=update_engine,
+		help="The multicore engine trains on several chunks at once, one in each worker process, " +
+			"but its topic models are not exactly reproducible")
+	number_of_training_workers = st.sidebar.number_input("Number of training workers", 1, os.cpu_count(),
+		max(1, os.cpu_count() - 1), key="number_of_training_workers", on_change=update_engine,
+		disabled=engine != "multicore", help="Use at most as many workers as chunks")
+	# the runs do not depend on the number of processes, so changing it does not refit them
+	st.sidebar.number_input("Number of parallel runs", 1, os.cpu_count(), min(4, os.cpu_count()), 
+		key="number_of_processes", help="Number of processes that fit the topic model runs at the same time")
+	if corpus is not None:
+		st.sidebar.markdown("Vocabulary of {} words, using about {:.1f} MB for {} topic models".format(
+			corpus.vocabulary_size(), number_of_runs * tm.estimated_model_memory(corpus, number_of_topics, 
+				engine, number_of_training_workers) / 2**20, number_of_runs))
+	# with a random seed, the runs are reproducible, and reused when they were fitted before
+	use_random_seed = st.sidebar.checkbox("Use random seed (for reproducibility)", value=True, 
+		key="use_random_seed", on_change=update_random_seed)
+	# seeds are non-negative, and gensim only accepts seeds below 2 ** 32
+	st.sidebar.number_input("Random seed", min_value=0, max_value=2**32 - 1, value=42, key="random_seed", 
+		on_change=update_random_seed, disabled=not use_random_seed, 
+		help="Each run uses a different seed derived from this one")
 	if st.sidebar.checkbox("Show topic model runs", value=False):
 		show_topic_model_runs(corpus, number_of_topics, number_of_chunks, number_of_runs)
 
 # application
 
 tm = TopicModel()
+token_cache = TokenCache()
+model_cache = ModelCache()
 app(tm)
\ No newline at end of file
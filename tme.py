@@ -10,40 +10,59 @@ import base64
 import re
 import string
 import pickle
+import os
 from datetime import datetime
-import graphviz as graphviz
-from pyvis.network import Network
-import networkx as nx
-from networkx.algorithms.community.centrality import girvan_newman
-from networkx.algorithms.community import greedy_modularity_communities
-from networkx.algorithms.community.quality import modularity
+# graphviz, pyvis and networkx are imported by the graph views that use them
 
-from topics import TopicModel, LDA
+from topics import TopicModel, LDA, Corpus, TokenCache, TRAINING_ENGINES
+from topics import topic_totals, topic_column, topic_co_occurrences, group_topic_weights
 
 # model
 
+# stopwords are removed from the lemmatized corpus, so that editing them does 
+# not preprocess the corpus again
 @st.cache(allow_output_mutation=True, persist=True)
-def load_corpus(url, stopwords, multiwords):
-	return tm.load_corpus(url, stopwords, multiwords)
+def load_corpus(url, multiwords, number_of_workers, streaming, phrases):
+	return tm.load_corpus(url, "", multiwords, number_of_workers, token_cache, streaming, 
+		serialized=streaming, phrases=phrases)
 
-@st.cache(hash_funcs={LDA: id}, persist=True)
+@st.cache(hash_funcs={Corpus: id}, allow_output_mutation=True)
+def filter_corpus(corpus, stopwords, min_document_frequency, max_document_frequency, max_vocabulary_size):
+	if corpus is None:
+		return None
+	return corpus.with_vocabulary(stopwords, min_document_frequency, max_document_frequency,
+		max_vocabulary_size)
+
+# the training engine and its workers are chosen in the sidebar, and are part of
+# the key of the cached topic model, as the model depends on them
 def topic_model(corpus, number_of_topics, number_of_chunks):
-	return tm.fit(corpus, number_of_topics, number_of_chunks=number_of_chunks)
+	return fit_topic_model(corpus, number_of_topics, number_of_chunks, engine, number_of_training_workers)
+
+@st.cache(hash_funcs={LDA: id}, persist=True)
+def fit_topic_model(corpus, number_of_topics, number_of_chunks, engine, number_of_workers):
+	return tm.fit(corpus, number_of_topics, number_of_chunks=number_of_chunks, engine=engine,
+		number_of_workers=number_of_workers)
 
 def topics(model):
 	return pd.DataFrame([[" ".join([tw[0] for tw in model.lda.show_topic(t, 10)])] 
 		for t in range(number_of_topics)])
 
+# the topics of the documents are inferred once per model and corpus, and shared
+# by all views; the matrix is read-only
+def document_topics(model, corpus):
+	return model.document_topics(corpus, number_of_workers, sparse_dtm)
+
 def document_topic_matrix(model, corpus):
-	return model.document_topic_matrix(corpus)
+	return model.document_topic_matrix(corpus, number_of_workers=number_of_workers, sparse=sparse_dtm)
 
 # sum document frequencies for each topic and normalize
 # thus, the column tallies add up to 1
 def tally_columns(dtm, number_of_topics):
-	return [sum([row[k] for row in dtm])/len(dtm) for k in range(number_of_topics)]
+	return topic_totals(dtm) / dtm.shape[0]
 
 def topic_coocurrence_graph(model, corpus, number_of_topics, min_weight, min_edges):
-	dtm = document_topic_matrix(model, corpus).to_numpy()
+	import graphviz
+	dtm = document_topics(model, corpus)
 	keywords = ["\n".join([tw[0] for tw in model.lda.show_topic(t, 3)])
 		for t in range(number_of_topics)]
 	graph = graphviz.Graph()
@@ -51,11 +70,7 @@ def topic_coocurrence_graph(model, corpus, number_of_topics, min_weight, min_edg
 	total_topic_weights = tally_columns(dtm, number_of_topics)
 	for i in range(number_of_topics):
 		graph.node(str(i), width=str(4*math.sqrt(total_topic_weights[i])), label=keywords[i])
-	edge = np.zeros((number_of_topics, number_of_topics))
-	for topic_weights in dtm:
-		topics = [k for k in range(number_of_topics) if topic_weights[k] >= min_weight]
-		for i, j in list(itertools.combinations(topics, 2)):
-			edge[i, j] = edge[i, j] + 1
+	edge = topic_co_occurrences(dtm, min_weight)
 	for i in range(number_of_topics):
 		for j in range(number_of_topics):
 			if edge[i, j] >= min_edges:
@@ -64,7 +79,10 @@ def topic_coocurrence_graph(model, corpus, number_of_topics, min_weight, min_edg
 	return graph
 
 def topic_coocurrence_graph_pyvis(model, corpus, number_of_topics, min_weight, min_edges, smooth_edges):
-	dtm = document_topic_matrix(model, corpus).to_numpy()
+	import networkx as nx
+	from networkx.algorithms.community import greedy_modularity_communities
+	from pyvis.network import Network
+	dtm = document_topics(model, corpus)
 	keywords = ["\n" + "\n".join([tw[0] for tw in model.lda.show_topic(t, 3)])
 		for t in range(number_of_topics)]
 	# graph = Network("600px", "100%", notebook=True, heading='')
@@ -76,11 +94,7 @@ def topic_coocurrence_graph_pyvis(model, corpus, number_of_topics, min_weight, m
 		# 	title="Topic {}".format(i))
 		G.add_node(i, label=keywords[i], size=4*10*math.sqrt(total_topic_weights[i]),
 			title="Topic {}".format(i))
-	edge = np.zeros((number_of_topics, number_of_topics))
-	for topic_weights in dtm:
-		topics = [k for k in range(number_of_topics) if topic_weights[k] >= min_weight]
-		for i, j in list(itertools.combinations(topics, 2)):
-			edge[i, j] = edge[i, j] + 1
+	edge = topic_co_occurrences(dtm, min_weight)
 	for i in range(number_of_topics):
 		for j in range(number_of_topics):
 			if edge[i, j] >= min_edges:
@@ -102,10 +116,13 @@ def topic_coocurrence_graph_pyvis(model, corpus, number_of_topics, min_weight, m
 	return graph
 
 def keyword_coocurrence_graph(model, corpus, selected_topic, min_edges, cut_off):
+	import networkx as nx
+	from networkx.algorithms.community import greedy_modularity_communities
+	from pyvis.network import Network
 	# step 1: select most relevant documents for the selected topic
-	dtm = document_topic_matrix(model, corpus).to_numpy()
+	dtm = document_topics(model, corpus)
 	top_documents = sort_by_topic(dtm, selected_topic, cut_off)
-	documents = corpus.documents['content'][top_documents]
+	documents = corpus.contents(top_documents)
 
 	# step 2a: parse the content of the documents and extract the unique words from each sentence
 	index = {}
@@ -118,8 +135,7 @@ def keyword_coocurrence_graph(model, corpus, selected_topic, min_edges, cut_off)
 			# sentence = re.sub(r'[^A-Za-z0-9]+', ' ', sentence)
 			# words = [word for word in sentence.lower().split(" ") 
 			# 	if word not in corpus.stopwords]
-			words = [word for word in corpus.tokenizer.tokenize([corpus.lemmatize(word) for word in corpus.tokenize(sentence)])
-				if word not in corpus.stopwords]
+			words = corpus.preprocess_document(sentence)
 			words = set(words)
 			for word in words:
 				if word not in index:
@@ -185,13 +201,13 @@ def keyword_coocurrence_graph(model, corpus, selected_topic, min_edges, cut_off)
 	return graph, [reverse_index[node] for node in nodes], top_documents
 	
 def sort_by_topic(dtm, k, cut_off=0.80):
-	col_k = [row[k] for row in dtm]
-	top_documents_index = np.argsort(-np.array(col_k))
+	col_k = topic_column(dtm, k)
+	top_documents_index = np.argsort(-col_k)
 	return [index for index in top_documents_index 
-		if dtm[index][k] >= cut_off]
+		if col_k[index] >= cut_off]
 
 def sort_topics(model, corpus):
-	dtm = document_topic_matrix(model, corpus).to_numpy()
+	dtm = document_topics(model, corpus)
 	total_topic_weights = tally_columns(dtm, number_of_topics)
 	top_topics = np.argsort(-np.array(total_topic_weights))
 	return top_topics
@@ -206,9 +222,11 @@ def show_documents(corpus):
 	st.header("Documents")
 	if corpus is not None:
 		if st.checkbox("Show table with full text", value=False):
-			st.table(corpus.documents)
+			st.table(corpus.document_frame())
 		else:
 			st.dataframe(corpus.documents, height=150)
+		if corpus.phrases is not None:
+			st.markdown("Detected phrases: {}".format(", ".join(corpus.detected_phrases())))
 		download_link_from_csv("\n".join(corpus.stopwords), "stopwords.txt",
 			"Download stopwords")
 	else:
@@ -308,7 +326,7 @@ def show_keyword_co_coccurrences(corpus, number_of_topics, number_of_chunks):
 			graph.show("keyword-graph.html")
 			components.html(open("keyword-graph.html", 'r', encoding='utf-8').read(), height=625)
 			st.markdown("Top-ranked documents for this topic")
-			top_documents_df = pd.DataFrame(corpus.documents).iloc[top_documents]
+			top_documents_df = corpus.document_frame(top_documents)
 			for i, row in top_documents_df.iterrows():
 				with st.expander(str(row["name"])):
 					document = annotated_document(corpus, row["content"], keywords)
@@ -327,13 +345,13 @@ def show_topic_trends(corpus, number_of_topics, number_of_chunks):
 				and the contribution of each topic by year. Note: The corpus must have a *year*
 				column. 
 			''')
-		dtm_df = document_topic_matrix(topic_model(corpus, number_of_topics, number_of_chunks), corpus)
+		dtm = document_topics(topic_model(corpus, number_of_topics, number_of_chunks), corpus)
 		if "year" in corpus.documents:
-			dtm_df.insert(0, "year", [str(year) for year in corpus.documents["year"]])
-			dtm_df_sum = dtm_df.groupby("year").sum()
+			dtm_df_sum = group_topic_weights(dtm, [str(year) for year in corpus.documents["year"]])
+			dtm_df_sum = dtm_df_sum.rename_axis("year")
 			st.bar_chart(dtm_df_sum)
 			dtm_df_sum_year = dtm_df_sum.copy()
-			dtm_df_sum_year.insert(0, "year", sorted(dtm_df["year"].unique()))
+			dtm_df_sum_year.insert(0, "year", dtm_df_sum.index)
 			download_link(dtm_df_sum_year, "topic-trends-{}.csv".format(number_of_topics),
 				"Download topic trends")
 
@@ -351,7 +369,7 @@ def download_link(dataframe, file_name, title="Download"):
 def show_topic_info(corpus, number_of_topics, number_of_chunks, selected_topic):
 	model = topic_model(corpus, number_of_topics, number_of_chunks)
 	topic_keywords = ", ".join([tw[0] for tw in model.lda.show_topic(selected_topic, 3)])
-	dtm = document_topic_matrix(model, corpus).to_numpy()
+	dtm = document_topics(model, corpus)
 	total_topic_weights = tally_columns(dtm, number_of_topics)
 	st.markdown("  ")
 	st.markdown("Keyword co-occurrences for topic **{}** ({}) with weight **{weight:.2f}**".format(
@@ -369,14 +387,15 @@ def topic_slider(number_of_topics):
 
 def annotated_document(corpus, document, keywords):
 	words_and_punctuation = re.findall(r'\w+|\W+', document)
-	words = [word for word in corpus.tokenizer.tokenize([corpus.lemmatize(word) for word in corpus.tokenize(document)])]	
+	# a merged multiword or phrase covers several words of the document
+	highlighted = [token in keywords for token in corpus.lemmatize_document(document) for _ in token.split("_")]
 	annotated_words = []
 	i = 0
 	for word in words_and_punctuation:
 		if is_punctuation(word):
 			annotated_words.append(word)
 		else:
-			if words[i] in keywords:
+			if highlighted[i]:
 				annotated_words.append("<span style=\"background-color: lightblue\">" + word + "</span>")
 			else:
 				annotated_words.append(word)
@@ -394,23 +413,59 @@ def is_punctuation(word):
 # controller
 
 tm = TopicModel()
+token_cache = TokenCache()
 
 st.sidebar.title("Topic Model Explorer")
 st.sidebar.write("Uses [streamlit](https://streamlit.io) {} and [gensim](https://radimrehurek.com/gensim/) {}".format(st.__version__, tm.gensim_version()))
 
-url = st.sidebar.file_uploader("Corpus", type="csv")
+url = st.sidebar.file_uploader("Corpus", type=["csv", "parquet", "arrow", "feather"])
 stopwords = st.sidebar.text_area("Stopwords (one per line)")
 multiwords = st.sidebar.text_area("Multiwords (one per line)")
-corpus = load_corpus(url, stopwords, multiwords)
+phrases = st.sidebar.checkbox("Detect phrases", value=False,
+	help="Merge pairs of words that often occur together, in addition to the multiwords")
+number_of_workers = st.sidebar.number_input("Number of workers", 1, os.cpu_count(), 1,
+	help="Number of processes used to preprocess the corpus and to infer the topics of its documents")
+streaming = st.sidebar.checkbox("Keep documents on disk", value=False,
+	help="Read the corpus in chunks, keep the text of the documents on disk, and stream the " +
+		"bag-of-words corpus from disk when fitting topic models (for large corpora)")
+sparse_dtm = st.sidebar.checkbox("Sparse document topic matrix", value=False,
+	help="Keep only the topic weights of documents that are not left out by the minimum probability " +
+		"of the topic model (for large corpora with many topics)")
+with st.sidebar.expander("Vocabulary"):
+	min_document_frequency = st.number_input("Minimum document frequency", 1, value=1,
+		help="Remove words that occur in fewer documents")
+	max_document_frequency = st.slider("Maximum document frequency", 0.05, 1.0, 1.0, step=0.05,
+		help="Remove words that occur in a larger share of the documents")
+	max_vocabulary_size = st.number_input("Maximum vocabulary size", 0, value=0,
+		help="Only keep this many of the most frequent words (0 keeps all words)")
+corpus = filter_corpus(load_corpus(url, multiwords, number_of_workers, streaming, phrases), stopwords,
+	min_document_frequency, max_document_frequency, max_vocabulary_size or None)
 
 if st.sidebar.checkbox("Show documents"):
 	show_documents(corpus)
+# settings that remove all words leave nothing to fit topic models to
+if corpus is not None and corpus.vocabulary_size() == 0:
+	st.markdown("No words are left in the vocabulary; remove some stopwords, or relax the " +
+		"vocabulary settings")
+	corpus = None
 
 number_of_topics = st.sidebar.slider("Number of topics", 1, 50, 10)
 
 # Default should be 1. 100 is the value used by Orange (https://orangedatamining.com). We include 
 # this option for compatibility with Orange and to examine the impact of this parameter.
 number_of_chunks = st.sidebar.slider("Number of chunks", 1, 100, 1)
+engine = st.sidebar.selectbox("Training engine", TRAINING_ENGINES,
+	help="The multicore engine trains on several chunks at once, one in each worker process, " +
+		"but its topic models are not exactly reproducible")
+number_of_training_workers = 1
+if engine == "multicore":
+	number_of_training_workers = st.sidebar.number_input("Number of training workers", 1, os.cpu_count(),
+		max(1, os.cpu_count() - 1), help="Use at most as many workers as chunks")
+
+if corpus is not None:
+	st.sidebar.markdown("Vocabulary of {} words, using about {:.1f} MB per topic model".format(
+		corpus.vocabulary_size(), tm.estimated_model_memory(corpus, number_of_topics, engine, 
+			number_of_training_workers) / 2**20))
 
 # The main reason to do this is that the first time a topic model is created, it does not
 # seem to be cached properly. Revisit, if this leads to long load times.
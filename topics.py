@@ -1,33 +1,611 @@
 # -*- coding: utf-8 -*-
 
-import streamlit as st
-
-import gensim as gs
-
-from gensim import models
-from gensim.models.coherencemodel import CoherenceModel
-# from gensim.models import ldamulticore
-from gensim.corpora import Dictionary
+# gensim, scipy and nltk take seconds to import, and are only needed once a corpus
+# is loaded, so they are imported on first use; the apps can start, and show their
+# sidebar, without them
 
 import pandas as pd
 import numpy as np
-from scipy.optimize import linear_sum_assignment
 import math
+import itertools
+
+import os
+import copy
+import time
+import sqlite3
+import hashlib
+import uuid
+import weakref
+import pickle
+import mmap
+import struct
+from array import array
 
 from io import StringIO
 from re import sub
+from functools import lru_cache
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+# lemmatization is shared by every corpus in this process: the same surface forms
+# recur across documents, sentences, and views, so each is looked up in WordNet
+# only once; lemma_cache_info() reports the hits and misses of the cache
+LEMMA_CACHE_SIZE = 2 ** 18
+
+# WordNet is looked up locally and never downloaded, so that the apps start offline;
+# it is installed once with: python -m nltk.downloader wordnet
+@lru_cache(maxsize=None)
+def wordnet_lemmatizer():
+	import nltk
+	from nltk.stem import WordNetLemmatizer
+	try:
+		nltk.data.find('corpora/wordnet')
+	except LookupError:
+		try:
+			nltk.data.find('corpora/wordnet.zip')
+		except LookupError:
+			raise LookupError("WordNet is not installed; run: python -m nltk.downloader wordnet")
+	return WordNetLemmatizer()
+
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def lemmatize_word(word):
+	table = lemma_table()
+	if table is not None:
+		return table.lemmatize(word)
+	return wordnet_lemmatizer().lemmatize(word)
+
+def lemma_cache_info():
+	return lemmatize_word.cache_info()
 
-import nltk
-from nltk.stem import WordNetLemmatizer
-from nltk.tokenize import MWETokenizer
+# instead of WordNet, words are lemmatized with a table compiled from it by 
+# build-lemma-table.py, if it exists; the table is memory-mapped read-only, so
+# worker processes and restarted apps share it instead of each loading WordNet
+LEMMA_TABLE_PATH = "cache/lemmas.bin"
+
+@lru_cache(maxsize=None)
+def lemma_table():
+	if os.path.exists(LEMMA_TABLE_PATH):
+		return LemmaTable(LEMMA_TABLE_PATH)
+	return None
+
+# read from the package metadata, so that nltk is not imported to check a lemma table
+def nltk_version():
+	from importlib.metadata import version
+	return version("nltk")
+
+# the nouns that WordNetLemmatizer.lemmatize changes, and their lemmas; lemmatize
+# returns the shortest of the word and the forms obtained from it by the exception 
+# list or by applying a substitution rule once, which are nouns in WordNet, so only
+# the words in the exception list and the words that a rule turns into a noun can 
+# change, and each of these is lemmatized by WordNet to build the table; other 
+# versions of nltk apply the rules differently, so the table records the version
+def wordnet_noun_lemmas():
+	from nltk.corpus import wordnet
+	lemmatizer = wordnet_lemmatizer()
+	words = set()
+	with wordnet.open("noun.exc") as file:
+		for line in file:
+			words.add(line.split()[0])
+	for noun in wordnet.all_lemma_names(pos='n'):
+		for old, new in wordnet.MORPHOLOGICAL_SUBSTITUTIONS['n']:
+			if noun.endswith(new):
+				words.add(noun[:len(noun) - len(new)] + old)
+	for word in sorted(words):
+		lemma = lemmatizer.lemmatize(word)
+		if lemma != word:
+			yield word, lemma
+
+"""
+Read-only table of words and their lemmas, stored in one file that is mapped
+into memory: a header, the offsets of the words and of the lemmas, and their 
+UTF-8 encoded bytes. The words are sorted, and looked up by binary search.
+Words that are not in the table are their own lemma. A table compiled with 
+another version of nltk than the installed one is refused.
+"""
+class LemmaTable:
+	MAGIC = b"LEMMAS02"
+	HEADER = struct.Struct("<8s32sqqq")
+
+	def __init__(self, path):
+		with open(path, 'rb') as file:
+			self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+		magic, version, self.size, words_size, lemmas_size = self.HEADER.unpack_from(self.buffer)
+		if magic != self.MAGIC:
+			raise ValueError("{} is not a lemma table of this version; run: python build-lemma-table.py".format(path))
+		version = version.rstrip(b"\0").decode()
+		if version != nltk_version():
+			raise ValueError("{} was compiled with nltk {}, but nltk {} is installed; "
+				"run: python build-lemma-table.py".format(path, version, nltk_version()))
+		view = memoryview(self.buffer)
+		start = self.HEADER.size
+		self.word_offsets = view[start:start + 8 * (self.size + 1)].cast('q')
+		start = start + 8 * (self.size + 1)
+		self.lemma_offsets = view[start:start + 8 * (self.size + 1)].cast('q')
+		# words and lemmas are sliced from the map by their absolute offsets
+		self.words_start = start + 8 * (self.size + 1)
+		self.lemmas_start = self.words_start + words_size
+
+	def __len__(self):
+		return self.size
+
+	def word(self, i):
+		return self.buffer[self.words_start + self.word_offsets[i]:self.words_start + self.word_offsets[i+1]]
+
+	def lemmatize(self, word):
+		key, buffer, offsets, start = word.encode(), self.buffer, self.word_offsets, self.words_start
+		low, high = 0, self.size
+		while low < high:
+			middle = (low + high) // 2
+			if buffer[start + offsets[middle]:start + offsets[middle+1]] < key:
+				low = middle + 1
+			else:
+				high = middle
+		if low < self.size and self.word(low) == key:
+			start = self.lemmas_start
+			return buffer[start + self.lemma_offsets[low]:start + self.lemma_offsets[low+1]].decode()
+		return word
+
+	# write the table atomically, so that processes never map a partial table
+	@staticmethod
+	def write(path, lemmas):
+		pairs = sorted((word.encode(), lemma.encode()) for word, lemma in lemmas)
+		words, lemmas = [pair[0] for pair in pairs], [pair[1] for pair in pairs]
+		word_offsets = np.zeros(len(pairs) + 1, dtype=np.int64)
+		word_offsets[1:] = np.cumsum([len(word) for word in words])
+		lemma_offsets = np.zeros(len(pairs) + 1, dtype=np.int64)
+		lemma_offsets[1:] = np.cumsum([len(lemma) for lemma in lemmas])
+		directory = os.path.dirname(path)
+		if directory:
+			os.makedirs(directory, exist_ok=True)
+		temporary_path = "{}.{}".format(path, uuid.uuid4().hex)
+		with open(temporary_path, 'wb') as file:
+			file.write(LemmaTable.HEADER.pack(LemmaTable.MAGIC, nltk_version().encode(), len(pairs), 
+				int(word_offsets[-1]), int(lemma_offsets[-1])))
+			file.write(word_offsets.astype('<i8').tobytes())
+			file.write(lemma_offsets.astype('<i8').tobytes())
+			file.write(b"".join(words))
+			file.write(b"".join(lemmas))
+		os.replace(temporary_path, path)
+
+# preprocessing of a shard of documents; this runs in a worker process when
+# the corpus is preprocessed in parallel, so it must not depend on a Corpus
+def tokenize_text(document):
+	return sub(r'[^A-Za-z0-9]+', ' ', document).lower().split()
+
+# preprocessing has two stages: the first stage lemmatizes the words of a document
+# and merges multiwords, the second stage removes the stopwords; as the first 
+# stage is kept, changing the stopwords only repeats the second stage
+def lemmatize_text(document, tokenizer):
+	return tokenizer.tokenize([lemmatize_word(word) for word in tokenize_text(document)])
+
+# multiwords are merged and stopwords removed in the same pass over the lemmas
+def preprocess_text(document, tokenizer, stopwords):
+	return tokenizer.tokenize([lemmatize_word(word) for word in tokenize_text(document)], stopwords)
+
+# the stopword file and the multiword tokenizers are read and built once per process,
+# and shared by the corpora and their vocabulary views; neither is modified after
+@lru_cache(maxsize=None)
+def read_stopword_file(file):
+	with open(file, 'r') as f:
+		return tuple(f.read().split('\n'))
+
+@lru_cache(maxsize=32)
+def multiword_tokenizer(multiwords):
+	return MultiwordTokenizer([mwe.split(' ') for mwe in multiwords.split('\n')])
+
+"""
+Tokenizer that merges multiwords into one token, joining their words with _, as
+NLTK's MWETokenizer: at each position, the longest multiword that starts there 
+is merged. The multiwords are compiled into a trie of dicts, one for each prefix
+of a multiword, which maps the next words to the dicts of the longer prefixes;
+the prefixes that are multiwords are marked by None. Stopwords can be removed 
+in the same pass, so each word is looked up only once in each.
+"""
+class MultiwordTokenizer:
+	def __init__(self, multiwords):
+		self.trie = {}
+		for multiword in multiwords:
+			node = self.trie
+			for word in multiword:
+				node = node.setdefault(word, {})
+			node[None] = True
+
+	def tokenize(self, words, stopwords=None):
+		trie, tokens = self.trie, []
+		i, n = 0, len(words)
+		while i < n:
+			word, node = words[i], trie.get(words[i])
+			i = i + 1
+			if node is not None:
+				# find the end of the longest multiword starting with this word
+				j, end = i, i if None in node else -1
+				while j < n and words[j] in node:
+					node = node[words[j]]
+					j = j + 1
+					if None in node:
+						end = j
+				if end > i:
+					word = "_".join(words[i-1:end])
+					i = end
+			if stopwords is None or word not in stopwords:
+				tokens.append(word)
+		return tokens
+
+# documents found in the token cache are not lemmatized again; the lemmas of
+# the other documents are returned, so that the caller can add them to the cache
+def preprocess_shard(documents, tokenizer, token_cache=None, configuration=""):
+	if token_cache is None:
+		lemmas, new_lemmas = [lemmatize_text(document, tokenizer) for document in documents], {}
+	else:
+		keys = [token_cache.key(document, configuration) for document in documents]
+		cached_lemmas = token_cache.get_many(keys)
+		lemmas, new_lemmas = [], {}
+		for key, document in zip(keys, documents):
+			if key not in cached_lemmas and key not in new_lemmas:
+				new_lemmas[key] = lemmatize_text(document, tokenizer)
+			lemmas.append(cached_lemmas[key] if key in cached_lemmas else new_lemmas[key])
+	return TokenArray.from_documents(lemmas), new_lemmas
+
+"""
+Tokens of all documents stored as one array of ids into a list of types. The
+tokens of document i are ids[offsets[i]:offsets[i+1]]. Indexing or iterating
+returns the tokens of a document as a list of words.
+"""
+class TokenArray:
+	def __init__(self, ids, offsets, types):
+		self.ids = ids
+		self.offsets = offsets
+		self.types = types
+
+	@staticmethod
+	def from_documents(documents):
+		index = {}
+		ids = [index.setdefault(word, len(index)) for document in documents for word in document]
+		offsets = np.zeros(len(documents) + 1, dtype=np.int64)
+		offsets[1:] = np.cumsum([len(document) for document in documents])
+		return TokenArray(np.array(ids, dtype=np.int32), offsets, list(index))
+
+	def fingerprint(self):
+		digest = hashlib.sha1()
+		digest.update(self.ids.tobytes())
+		digest.update(self.offsets.tobytes())
+		digest.update("\n".join(self.types).encode())
+		return digest.hexdigest()
+
+	# join the token arrays of consecutive shards, mapping their types to a common list,
+	# unless their ids already refer to the same types
+	@staticmethod
+	def concatenate(token_arrays, types=None):
+		index = {}
+		ids, offsets = [], [np.zeros(1, dtype=np.int64)]
+		for token_array in token_arrays:
+			if types is None:
+				type_ids = np.array([index.setdefault(word, len(index)) for word in token_array.types], 
+					dtype=np.int32)
+				ids.append(type_ids[token_array.ids] if len(type_ids) > 0 else token_array.ids)
+			else:
+				ids.append(token_array.ids)
+			offsets.append(token_array.offsets[1:] + offsets[-1][-1])
+		return TokenArray(np.concatenate(ids), np.concatenate(offsets), list(index) if types is None else types)
+
+	def __len__(self):
+		return len(self.offsets) - 1
+
+	def __getitem__(self, i):
+		return [self.types[id] for id in self.ids[self.offsets[i]:self.offsets[i+1]]]
+
+	def __iter__(self):
+		for i in range(len(self)):
+			yield self[i]
+
+	def lengths(self):
+		return np.diff(self.offsets)
+
+	# keep the tokens whose type is marked in keep, and build a dictionary for them; 
+	# ids are assigned in the same order as by Dictionary(tokens), that is, by the first 
+	# document that contains a word, and alphabetically within a document
+	def filter(self, keep):
+		from gensim.corpora import Dictionary
+		number_of_documents, number_of_types = len(self), len(self.types)
+		types, documents, offsets = self.mask(keep)
+		# distinct (document, type) pairs, sorted by document
+		pairs = np.unique(documents * number_of_types + types)
+		pair_types, pair_documents = pairs % number_of_types, pairs // number_of_types
+		used_types, first_pairs = np.unique(pair_types, return_index=True)
+		ranks = np.empty(number_of_types, dtype=np.int64)
+		ranks[np.argsort(np.array(self.types, dtype=object))] = np.arange(number_of_types)
+		order = used_types[np.lexsort((ranks[used_types], pair_documents[first_pairs]))]
+		new_ids = np.full(number_of_types, -1, dtype=np.int32)
+		new_ids[order] = np.arange(len(order), dtype=np.int32)
+		words = [self.types[t] for t in order]
+		dictionary = Dictionary()
+		dictionary.token2id = dict(zip(words, range(len(words))))
+		dictionary.dfs = dict(enumerate(np.bincount(pair_types, minlength=number_of_types)[order].tolist()))
+		dictionary.cfs = dict(enumerate(np.bincount(types, minlength=number_of_types)[order].tolist()))
+		dictionary.num_docs = number_of_documents
+		dictionary.num_pos = len(types)
+		dictionary.num_nnz = len(pairs)
+		return TokenArray(new_ids[types], offsets, words), dictionary
+
+	# the types of the tokens whose type is marked in keep, the documents of those 
+	# tokens, and the offsets of the documents once the other tokens are removed
+	def mask(self, keep):
+		mask = keep[self.ids] if len(keep) > 0 else np.zeros(0, dtype=bool)
+		documents = np.repeat(np.arange(len(self), dtype=np.int64), self.lengths())[mask]
+		offsets = np.zeros(len(self) + 1, dtype=np.int64)
+		offsets[1:] = np.cumsum(np.bincount(documents, minlength=len(self)))
+		return self.ids[mask], documents, offsets
+
+# the number of ids of a hashed vocabulary (see vocabulary.py)
+HASHED_VOCABULARY_SIZE = 2 ** 18
+
+"""
+Streamed bag-of-words view of a document-term matrix, in the format gensim 
+expects for a corpus: each document is a list of (id, count) tuples.
+"""
+class BowCorpus:
+	def __init__(self, matrix):
+		self.matrix = matrix
+
+	def __len__(self):
+		return self.matrix.shape[0]
+
+	def __getitem__(self, i):
+		start, end = self.matrix.indptr[i], self.matrix.indptr[i+1]
+		return list(zip(self.matrix.indices[start:end].tolist(), self.matrix.data[start:end].tolist()))
+
+	def __iter__(self):
+		for i in range(len(self)):
+			yield self[i]
+
+# files left behind by an interrupted write are removed once they are this old, as 
+# a write in progress in another process keeps changing its file
+TEMPORARY_FILE_AGE = 3600	# seconds
+
+# evict the least recently used files of a directory whose names start with prefix and
+# end with suffix, while their total size exceeds max_size, except the files in keep;
+# the modification time of a file records when it was last used; the companions of a 
+# file (such as its index) are counted, and removed, with it; files written under the
+# name of such a file and a random suffix, to be renamed, are left behind when a write
+# is interrupted, and are removed as well
+def evict_least_recently_used(directory, prefix, suffix, max_size, keep=(), companions=()):
+	files, size_kept = [], 0
+	for name in os.listdir(directory):
+		path = os.path.join(directory, name)
+		if not name.startswith(prefix) or any(name.endswith(suffix + companion) for companion in companions):
+			continue
+		if name.endswith(suffix):
+			size = sum(os.path.getsize(path + companion) for companion in ("",) + companions 
+				if os.path.exists(path + companion))
+			if path in keep:
+				size_kept = size_kept + size
+			else:
+				files.append((os.stat(path).st_mtime, size, path))
+		elif suffix + "." in name and time.time() - os.stat(path).st_mtime > TEMPORARY_FILE_AGE:
+			os.remove(path)
+	excess = sum(size for _, size, _ in files) + size_kept - max_size
+	for _, size, path in sorted(files):
+		if excess <= 0:
+			break
+		for companion in ("",) + companions:
+			if os.path.exists(path + companion):
+				os.remove(path + companion)
+		excess = excess - size
+
+# bump the version when preprocessing changes, so that stale tokens are not reused
+TOKEN_CACHE_VERSION = 2
+TOKEN_CACHE_PATH = "cache/tokens.sqlite"
+TOKEN_CACHE_SIZE = 2 ** 30	# bytes
+TOKEN_CACHE_BATCH_SIZE = 500
+
+"""
+On-disk cache of lemmatized documents. The lemmas of a document are stored
+under a hash of its content and of the preprocessing configuration, so they
+can be reused across corpora and restarts. When the total size of the cached 
+lemmas exceeds max_size, the least recently used entries are evicted.
+"""
+class TokenCache:
+	def __init__(self, path=TOKEN_CACHE_PATH, max_size=TOKEN_CACHE_SIZE):
+		self.path = path
+		self.max_size = max_size
+		if os.path.dirname(path):
+			os.makedirs(os.path.dirname(path), exist_ok=True)
+		with self.connect() as connection:
+			# write-ahead logging lets worker processes read while another one writes
+			connection.execute("PRAGMA journal_mode=WAL")
+			connection.execute("CREATE TABLE IF NOT EXISTS tokens "
+				"(key TEXT PRIMARY KEY, tokens TEXT, size INTEGER, last_used REAL)")
+			connection.execute("CREATE INDEX IF NOT EXISTS tokens_last_used ON tokens (last_used)")
+
+	# connect anew for each operation, so that the cache can be shared with 
+	# (and pickled for) worker processes; the connection is closed afterwards, 
+	# as worker processes must not inherit an open connection
+	@contextmanager
+	def connect(self):
+		connection = sqlite3.connect(self.path, timeout=60)
+		try:
+			with connection:
+				yield connection
+		finally:
+			connection.close()
+
+	def key(self, document, configuration):
+		return hashlib.sha1("{}\0{}".format(configuration, document).encode()).hexdigest()
+
+	def get_many(self, keys):
+		tokens = {}
+		keys = list(set(keys))
+		with self.connect() as connection:
+			for i in range(0, len(keys), TOKEN_CACHE_BATCH_SIZE):
+				batch = keys[i:i + TOKEN_CACHE_BATCH_SIZE]
+				rows = connection.execute("SELECT key, tokens FROM tokens WHERE key IN ({})".format(
+					",".join("?" * len(batch))), batch).fetchall()
+				for key, document_tokens in rows:
+					tokens[key] = document_tokens.split(" ") if document_tokens else []
+			connection.executemany("UPDATE tokens SET last_used = ? WHERE key = ?",
+				[(time.time(), key) for key in tokens])
+		return tokens
+
+	def put_many(self, tokens):
+		rows = [(key, " ".join(document_tokens)) for key, document_tokens in tokens.items()]
+		with self.connect() as connection:
+			connection.executemany("INSERT OR REPLACE INTO tokens VALUES (?, ?, ?, ?)",
+				[(key, document_tokens, len(document_tokens), time.time()) for key, document_tokens in rows])
+		self.evict()
+
+	def size(self):
+		with self.connect() as connection:
+			return connection.execute("SELECT COALESCE(SUM(size), 0) FROM tokens").fetchone()[0]
+
+	def evict(self):
+		excess = self.size() - self.max_size
+		if excess <= 0:
+			return
+		evicted_keys = []
+		with self.connect() as connection:
+			for key, size in connection.execute("SELECT key, size FROM tokens ORDER BY last_used"):
+				evicted_keys.append((key,))
+				excess = excess - size
+				if excess <= 0:
+					break
+			connection.executemany("DELETE FROM tokens WHERE key = ?", evicted_keys)
+
+	# phrase models are saved next to the cache, under a key for the lemmas they were trained on;
+	# when their total size exceeds PHRASES_CACHE_SIZE, the least recently used are evicted
+	def phrases_path(self, key):
+		return os.path.join(os.path.dirname(self.path), "phrases-{}.pkl".format(key))
+
+	def evict_phrases(self, path):
+		evict_least_recently_used(os.path.dirname(self.path) or ".", "phrases-", ".pkl", PHRASES_CACHE_SIZE, {path})
+
+# phrases are scored as by gensim's Phrases, with its defaults
+PHRASES_MIN_COUNT = 5
+PHRASES_THRESHOLD = 10.0
+PHRASES_CACHE_SIZE = 2 ** 28	# bytes
+
+SPILL_DIRECTORY = "cache/documents"
+SPILL_DIRECTORY_SIZE = 2 ** 33	# bytes
+
+"""
+Contents of documents spilled to disk when a corpus is loaded in chunks. Only
+the offsets of the documents are kept in memory; the text of a document is
+read back when it is needed. The documents are written to a segment file until 
+it is closed; the segment is then named after its contents, so that documents
+that are loaded again (with other preprocessing) reuse it instead of spilling
+another copy. When the total size of the segments exceeds max_size, the least 
+recently used ones are evicted, except the segments of open spill files, which 
+hold the only copy of their documents; the segments of a spill file are removed
+when it is released, unless another open spill file shares them.
+"""
+class SpillFile:
+	# the spill files of the process that are in use
+	open_files = weakref.WeakSet()
+
+	def __init__(self, directory=SPILL_DIRECTORY, max_size=SPILL_DIRECTORY_SIZE):
+		self.directory = directory
+		self.max_size = max_size
+		self.offsets = array('q', [0])
+		# the path, first document and first offset of each segment
+		self.paths, self.first_documents, self.first_offsets = [], [], []
+		self.digest = None
+		os.makedirs(directory, exist_ok=True)
+		SpillFile.open_files.add(self)
+		# the segments are kept at exit, for spill files that were pickled (such as by a 
+		# cache that persists), and are evicted later, once they are no longer used
+		weakref.finalize(self, remove_segments, self.paths).atexit = False
+
+	# a copy, such as an unpickled one, keeps the segments from being evicted, but
+	# does not remove them when it is released, as the original may still use them
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		SpillFile.open_files.add(self)
+
+	def append(self, documents):
+		if self.digest is None:
+			self.digest = hashlib.sha1()
+			self.paths.append(os.path.join(self.directory, "documents-{}.part".format(uuid.uuid4().hex)))
+			self.first_documents.append(len(self))
+			self.first_offsets.append(self.offsets[-1])
+		with open(self.paths[-1], 'ab') as file:
+			for document in documents:
+				data = document.encode('utf-8')
+				file.write(data)
+				self.digest.update(data)
+				self.offsets.append(self.offsets[-1] + len(data))
+
+	# name the segment being written after its contents; documents appended later 
+	# go to a new segment, as a closed segment may be shared with other corpora
+	def close(self):
+		if self.digest is None:
+			return
+		path = os.path.join(self.directory, "documents-{}.txt".format(self.digest.hexdigest()))
+		os.replace(self.paths[-1], path)
+		self.paths[-1] = path
+		self.digest = None
+		self.evict()
+
+	def __len__(self):
+		return len(self.offsets) - 1
+
+	def __getitem__(self, i):
+		return self.read_many([i])[0]
+
+	def read_many(self, indices):
+		documents = []
+		segments = np.searchsorted(self.first_documents, indices, side='right') - 1
+		for segment in np.unique(segments):
+			# the modification time of a segment records when it was last used
+			os.utime(self.paths[segment])
+		files = {}
+		try:
+			for i, segment in zip(indices, segments):
+				if segment not in files:
+					files[segment] = open(self.paths[segment], 'rb')
+				files[segment].seek(self.offsets[i] - self.first_offsets[segment])
+				documents.append(files[segment].read(self.offsets[i+1] - self.offsets[i]).decode('utf-8'))
+		finally:
+			for file in files.values():
+				file.close()
+		return documents
+
+	# segments that are still being written (.part) are never evicted
+	def evict(self):
+		evict_least_recently_used(self.directory, "documents-", ".txt", self.max_size, open_segments())
+
+def open_segments():
+	return {path for spill_file in list(SpillFile.open_files) for path in spill_file.paths}
+
+def remove_segments(paths):
+	open_paths = open_segments()
+	for path in paths:
+		if path not in open_paths and os.path.exists(path):
+			os.remove(path)
+
+# several shards per worker balance the load when documents differ in length
+SHARDS_PER_WORKER = 4
+MIN_DOCUMENTS_PER_SHARD = 500
+CORPUS_DIRECTORY = "cache/corpora"
+CORPUS_DIRECTORY_SIZE = 2 ** 32	# bytes
+
+# evict the least recently used serialized corpora (and their index files) from the 
+# directory while their total size exceeds max_size, except the corpus at path, and 
+# the corpora that worker processes may be streaming
+def evict_corpora(directory, path, max_size=CORPUS_DIRECTORY_SIZE):
+	keep = {corpus.path for corpus in list(SerializedCorpus.open_corpora)} | {path}
+	evict_least_recently_used(directory, "corpus-", ".mm", max_size, keep, (".index",))
 
 """
 Corpus of documents.
 """
 class Corpus:
-	def __init__(self, documents):
+	def __init__(self, documents, spill_file=None):
 		# TODO: do I still need to check for that, or is unicode handled fine now?
-		self.documents = self.to_ascii(documents)
+		self.spill_file = spill_file
+		self.documents = self.to_ascii(documents) if spill_file is None else documents
+		self.corpus_directory = None
+		self.hashed_vocabulary = None
+		self.phrases = None
+		self.set_pruning()
 
 	def to_ascii(self, documents):
 		# replace non-ascii symbols left by text processing software
@@ -35,89 +613,674 @@ class Corpus:
 			for document in documents['content']]
 		return documents
 
-	def preprocess(self, user_defined_stopwords, multiwords):
+	def preprocess(self, user_defined_stopwords, multiwords, number_of_workers=1, token_cache=None,
+			phrases=False):
+		self.check_phrases(phrases)
+		self.set_stopwords(user_defined_stopwords)
+		self.multiwords = multiwords
+		self.tokenizer = self.create_tokenizer(multiwords)
+		configuration = self.configuration(multiwords)
+		with ProcessPoolExecutor(max_workers=number_of_workers) as executor:
+			lemmas = self.lemmatize_documents(list(self.documents['content']), number_of_workers, 
+				executor, token_cache, configuration)
+		if self.hashed_vocabulary is not None:
+			self.set_hashed_tokens([self.hash_lemmas(lemmas)])
+		else:
+			self.lemmas = self.detect_phrases(lemmas, token_cache) if phrases else lemmas
+			self.filter_tokens()
+
+	# preprocess a corpus read in chunks; the contents of the documents are 
+	# spilled to disk, and only the other columns are kept in memory
+	def preprocess_chunks(self, chunks, user_defined_stopwords, multiwords, number_of_workers=1, 
+			token_cache=None, phrases=False):
+		self.check_phrases(phrases)
+		self.set_stopwords(user_defined_stopwords)
+		self.multiwords = multiwords
+		self.tokenizer = self.create_tokenizer(multiwords)
+		configuration = self.configuration(multiwords)
+		lemmas, documents = [], []
+		with ProcessPoolExecutor(max_workers=number_of_workers) as executor:
+			for chunk in chunks:
+				contents = list(self.to_ascii(chunk)['content'])
+				chunk_lemmas = self.lemmatize_documents(contents, number_of_workers, executor, 
+					token_cache, configuration)
+				lemmas.append(chunk_lemmas if self.hashed_vocabulary is None else self.hash_lemmas(chunk_lemmas))
+				self.spill_file.append(contents)
+				documents.append(chunk.drop(columns='content'))
+		self.spill_file.close()
+		self.documents = pd.concat(documents, ignore_index=True)
+		if self.hashed_vocabulary is not None:
+			self.set_hashed_tokens(lemmas)
+		else:
+			self.lemmas = TokenArray.concatenate(lemmas)
+			if phrases:
+				self.lemmas = self.detect_phrases(self.lemmas, token_cache)
+			self.filter_tokens()
+
+	def lemmatize_documents(self, documents, number_of_workers=1, executor=None, token_cache=None, 
+			configuration=""):
+		if number_of_workers > 1 and len(documents) >= MIN_DOCUMENTS_PER_SHARD * 2:
+			lemmas, new_lemmas = self.preprocess_parallel(documents, number_of_workers, executor, 
+				token_cache, configuration)
+		else:
+			lemmas, new_lemmas = preprocess_shard(documents, self.tokenizer, token_cache, configuration)
+		if token_cache is not None and new_lemmas:
+			token_cache.put_many(new_lemmas)
+		return lemmas
+
+	# shard the documents across a pool of worker processes; the shards are
+	# contiguous and returned in order, so the order of the documents is kept
+	def preprocess_parallel(self, documents, number_of_workers, executor, token_cache=None, 
+			configuration=""):
+		number_of_shards = min(number_of_workers * SHARDS_PER_WORKER, 
+			len(documents) // MIN_DOCUMENTS_PER_SHARD)
+		shard_size = math.ceil(len(documents) / number_of_shards)
+		shards = [documents[i:i + shard_size] for i in range(0, len(documents), shard_size)]
+		results = list(executor.map(preprocess_shard, shards, [self.tokenizer] * len(shards), 
+			[token_cache] * len(shards), [configuration] * len(shards)))
+		new_lemmas = {key: document for _, shard_new_lemmas in results 
+			for key, document in shard_new_lemmas.items()}
+		return TokenArray.concatenate([shard_lemmas for shard_lemmas, _ in results]), new_lemmas
+
+	# with a hashed vocabulary, the stopwords are removed from the lemmas of each chunk, 
+	# and the remaining lemmas hashed, right away; thus, no vocabulary is built, but 
+	# the lemmas are not kept either, and the stopwords cannot be changed later
+	def use_hashed_vocabulary(self, id_range=HASHED_VOCABULARY_SIZE):
+		from vocabulary import HashedVocabulary
+		self.hashed_vocabulary = HashedVocabulary(id_range)
+
+	def hash_lemmas(self, lemmas):
+		keep = np.array([word not in self.stopword_set for word in lemmas.types], dtype=bool)
+		types, _, offsets = lemmas.mask(keep)
+		ids = np.array([self.hashed_vocabulary.restricted_hash(word) for word in lemmas.types], dtype=np.int32)
+		counts = np.bincount(types, minlength=len(lemmas.types))
+		kept_types = np.flatnonzero(keep)
+		self.hashed_vocabulary.add_labels([lemmas.types[t] for t in kept_types], 
+			ids[kept_types].tolist(), counts[kept_types].tolist())
+		return TokenArray(ids[types], offsets, self.hashed_vocabulary)
+
+	def set_hashed_tokens(self, token_arrays):
+		self.lemmas = None
+		self.tokens = TokenArray.concatenate(token_arrays, self.hashed_vocabulary)
+		self.dictionary = self.hashed_vocabulary
+		self.dictionary.num_docs = len(self.tokens)
+		self.dictionary.num_pos = len(self.tokens.ids)
+		self.bow_matrix = None
+		self.mm_corpus = None
+
+	# append documents to the corpus, preprocessed as the other documents; the new
+	# words are added to the dictionary, after the other words, so that their ids do 
+	# not change; words that are new to a pruned vocabulary are left out, though, as 
+	# the vocabulary is only pruned when the corpus is filtered again; returns the 
+	# index of the first appended document
+	def append(self, documents, number_of_workers=1, token_cache=None):
+		first_document = self.number_of_documents()
+		contents = list(self.to_ascii(documents)['content'])
+		with ProcessPoolExecutor(max_workers=number_of_workers) as executor:
+			lemmas = self.lemmatize_documents(contents, number_of_workers, executor, token_cache, 
+				self.configuration(self.multiwords))
+		if self.phrases is not None:
+			lemmas = TokenArray.from_documents([self.phrases[document] for document in lemmas])
+		if self.spill_file is not None:
+			self.spill_file.append(contents)
+			self.spill_file.close()
+			documents = documents.drop(columns='content')
+		self.documents = pd.concat([self.documents, documents], ignore_index=True)
+		if self.hashed_vocabulary is not None:
+			self.set_hashed_tokens([self.tokens, self.hash_lemmas(lemmas)])
+		else:
+			self.lemmas = TokenArray.concatenate([self.lemmas, lemmas])
+			self.extend_tokens(lemmas)
+		return first_document
+
+	# add documents to the dictionary as Dictionary.add_documents does, which assigns 
+	# ids to new words in the same order as filter does for the whole corpus
+	def extend_tokens(self, lemmas):
+		documents = [[word for word in document if word not in self.stopword_set] for document in lemmas]
+		if self.is_pruned():
+			documents = [[word for word in document if word in self.dictionary.token2id] for document in documents]
+		number_of_types = len(self.dictionary)
+		self.dictionary.add_documents(documents, prune_at=None)
+		new_words = [word for word, id in self.dictionary.token2id.items() if id >= number_of_types]
+		types = self.tokens.types + sorted(new_words, key=self.dictionary.token2id.get)
+		ids = np.array([self.dictionary.token2id[word] for document in documents for word in document], dtype=np.int32)
+		offsets = np.zeros(len(documents) + 1, dtype=np.int64)
+		offsets[1:] = np.cumsum([len(document) for document in documents])
+		self.tokens = TokenArray.concatenate([self.tokens, TokenArray(ids, offsets, types)], types)
+		self.bow_matrix = None
+		self.mm_corpus = None
+
+	# phrases, that is, pairs of words that occur together more often than by chance,
+	# are detected in the lemmas and merged like multiwords; the phrase model is 
+	# trained in one pass over the lemmas and frozen, and saved with the token cache,
+	# so that loading the same corpus again only applies it
+	def detect_phrases(self, lemmas, token_cache=None):
+		from gensim.models.phrases import Phrases, FrozenPhrases, ENGLISH_CONNECTOR_WORDS
+		path = None
+		if token_cache is not None:
+			path = token_cache.phrases_path(hashlib.sha1("{}\0{}\0{}".format(lemmas.fingerprint(), 
+				PHRASES_MIN_COUNT, PHRASES_THRESHOLD).encode()).hexdigest())
+		if path is not None and os.path.exists(path):
+			self.phrases = FrozenPhrases.load(path)
+			os.utime(path)
+		else:
+			self.phrases = Phrases(lemmas, min_count=PHRASES_MIN_COUNT, threshold=PHRASES_THRESHOLD,
+				connector_words=ENGLISH_CONNECTOR_WORDS).freeze()
+			if path is not None:
+				temporary_path = "{}.{}".format(path, uuid.uuid4().hex)
+				self.phrases.save(temporary_path)
+				os.replace(temporary_path, path)
+				token_cache.evict_phrases(path)
+		return TokenArray.from_documents([self.phrases[document] for document in lemmas])
+
+	def check_phrases(self, phrases):
+		if phrases and self.hashed_vocabulary is not None:
+			raise ValueError("phrases cannot be detected with a hashed vocabulary, as the lemmas are not kept")
+
+	# the detected phrases, from the highest to the lowest score
+	def detected_phrases(self):
+		if self.phrases is None:
+			return []
+		return sorted(self.phrases.phrasegrams, key=self.phrases.phrasegrams.get, reverse=True)
+
+	# everything besides the content of a document that determines its lemmas
+	def configuration(self, multiwords):
+		return "{}\0{}".format(TOKEN_CACHE_VERSION, multiwords)
+
+	def set_stopwords(self, user_defined_stopwords):
 		self.stopwords_en = self.read_stopwords("stopwords-en.txt")
 		self.user_defined_stopwords = user_defined_stopwords.split('\n')
 		self.user_defined_stopwords = [word.strip() for word in self.user_defined_stopwords]
 		self.stopwords = self.stopwords_en + self.user_defined_stopwords
-		self.tokenizer = self.create_tokenizer(multiwords)
-		self.tokens = [[word for word in self.tokenizer.tokenize([self.lemmatize(word) for word in self.tokenize(document)])
-				if word not in self.stopwords]
-			for document in self.documents['content']]
-		# self.tokens = [word for word in [[self.lemmatize(word) for word in self.tokenize(document)]
-		# 	for document in self.documents['content']]]
-		# self.tokens = [tokenizer.tokenize(word_list) for word_list in self.tokens]
-		# self.tokens = [word for word in word_list if word not in self.stopwords]
-		self.dictionary = Dictionary(self.tokens)
+		self.stopword_set = set(self.stopwords)
+
+	# only repeat the second stage of preprocessing
+	def filter_stopwords(self, user_defined_stopwords):
+		self.set_stopwords(user_defined_stopwords)
+		self.filter_tokens()
+
+	# remove rare and frequent words from the vocabulary, as gensim's filter_extremes
+	# does: keep words that occur in at least min_document_frequency documents and 
+	# in at most max_document_frequency (a ratio) of the documents, and only keep the
+	# max_vocabulary_size most frequent of those words
+	def prune(self, min_document_frequency=1, max_document_frequency=1.0, max_vocabulary_size=None):
+		self.set_pruning(min_document_frequency, max_document_frequency, max_vocabulary_size)
+		self.filter_tokens()
+
+	def set_pruning(self, min_document_frequency=1, max_document_frequency=1.0, max_vocabulary_size=None):
+		self.min_document_frequency = min_document_frequency
+		self.max_document_frequency = max_document_frequency
+		self.max_vocabulary_size = max_vocabulary_size
+
+	def is_pruned(self):
+		return (self.min_document_frequency > 1 or self.max_document_frequency < 1.0 
+			or self.max_vocabulary_size is not None)
+
+	# stopwords are looked up once per type, not once per token
+	def filter_tokens(self):
+		if self.hashed_vocabulary is not None:
+			raise ValueError("The vocabulary of a corpus with hashed words cannot be changed")
+		keep = np.array([word not in self.stopword_set for word in self.lemmas.types], dtype=bool)
+		self.tokens, self.dictionary = self.lemmas.filter(keep)
+		if self.is_pruned():
+			self.tokens, self.dictionary = self.tokens.filter(self.words_to_keep())
+		self.bow_matrix = None
+		self.mm_corpus = None
+
+	# ties between words with the same document frequency are broken by their id
+	def words_to_keep(self):
+		dfs = np.array([self.dictionary.dfs.get(id, 0) for id in range(len(self.dictionary))], dtype=np.int64)
+		max_document_frequency = int(self.max_document_frequency * self.dictionary.num_docs)
+		keep = (dfs >= self.min_document_frequency) & (dfs <= max_document_frequency)
+		if self.max_vocabulary_size is not None:
+			ids = np.flatnonzero(keep)
+			ids = ids[np.argsort(-dfs[ids], kind='stable')][:self.max_vocabulary_size]
+			keep = np.zeros(len(dfs), dtype=bool)
+			keep[ids] = True
+		return keep
+
+	# a copy of the corpus with a different vocabulary, which shares the documents 
+	# and lemmas with this corpus
+	def with_vocabulary(self, user_defined_stopwords, min_document_frequency=1, max_document_frequency=1.0,
+			max_vocabulary_size=None):
+		corpus = copy.copy(self)
+		corpus.set_stopwords(user_defined_stopwords)
+		corpus.prune(min_document_frequency, max_document_frequency, max_vocabulary_size)
+		return corpus
+
+	def vocabulary_size(self):
+		return len(self.dictionary)
 
 	def preprocess_document(self, document):
-		return [word for word in self.tokenizer.tokenize([self.lemmatize(word) for word in self.tokenize(document)])
-			if word not in self.stopwords]
+		if self.phrases is None:
+			return preprocess_text(document, self.tokenizer, self.stopword_set)
+		return [word for word in self.lemmatize_document(document) if word not in self.stopword_set]
+
+	# the lemmas of a document, with multiwords and phrases merged as in the corpus, but
+	# with the stopwords kept, so that they line up with the words of the document
+	def lemmatize_document(self, document):
+		lemmas = lemmatize_text(document, self.tokenizer)
+		return lemmas if self.phrases is None else self.phrases[lemmas]
+
+	# the contents of the documents, read back from disk if they were spilled
+	def contents(self, indices=None):
+		if indices is None:
+			indices = range(len(self.documents))
+		if self.spill_file is None:
+			return self.documents['content'][indices]
+		return pd.Series(self.spill_file.read_many(indices), index=indices, name='content')
+
+	# the documents with the given indices, including their contents
+	def document_frame(self, indices=None):
+		if self.spill_file is None:
+			return self.documents if indices is None else self.documents.iloc[indices]
+		documents = self.documents if indices is None else self.documents.iloc[indices]
+		return documents.assign(content=self.contents(documents.index).values)
 
 	def read_stopwords(self, file):
-		file = open(file, 'r')
-		return file.read().split('\n')
+		return list(read_stopword_file(file))
 
 	def create_tokenizer(self, multiwords):
-		tokenizer = MWETokenizer()
-		for mwe in tokenizer.tokenize(multiwords.split('\n')):
-			tokenizer.add_mwe(mwe.split(' '))
-		return tokenizer
+		return multiword_tokenizer(multiwords)
 
 	def tokenize(self, document):
-		return sub(r'[^A-Za-z0-9]+', ' ', document).lower().split()
+		return tokenize_text(document)
 
 	def lemmatize(self, word):
-		lemmatizer = WordNetLemmatizer()
-		return lemmatizer.lemmatize(word)
+		return lemmatize_word(word)
 
+	# the document-term matrix is only computed once; the bag-of-words corpus 
+	# streams its rows, from disk if the corpus is serialized; the file is opened on
+	# each pass, and written again if it was evicted since
 	def bow(self):
-		return [self.dictionary.doc2bow(doc) for doc in self.tokens]
+		if self.corpus_directory is not None:
+			self.bow_file()
+			if self.mm_corpus is None:
+				self.mm_corpus = self.serialize_bow()
+			return self.mm_corpus
+		if self.bow_matrix is None:
+			self.bow_matrix = self.bow_rows(0)
+		return BowCorpus(self.bow_matrix)
+
+	# the document-term matrix of the documents from first_document on
+	def bow_rows(self, first_document):
+		from scipy.sparse import csr_matrix
+		start = self.tokens.offsets[first_document]
+		offsets = self.tokens.offsets[first_document:] - start
+		# copy the ids, as summing duplicates sorts them in place
+		matrix = csr_matrix((np.ones(len(self.tokens.ids) - start, dtype=np.int32), 
+			self.tokens.ids[start:], offsets), shape=(len(offsets) - 1, len(self.dictionary)), copy=True)
+		matrix.sum_duplicates()
+		return matrix
+
+	# serialize the bag-of-words corpus in Matrix Market format, and stream it from 
+	# disk instead of keeping it in memory; the file is named after the tokens, so 
+	# that it is written once and can be shared by processes that load the same corpus
+	def serialize(self, directory=CORPUS_DIRECTORY):
+		self.corpus_directory = directory
+		self.bow_matrix = None
+		self.mm_corpus = None
+
+	def serialize_bow(self):
+		from gensim.corpora import MmCorpus
+		return MmCorpus(self.bow_file())
+
+	# the path of the serialized bag-of-words corpus, which is written if it does not 
+	# exist; a new corpus evicts the least recently used ones if the directory is full
+	def bow_file(self):
+		from gensim.corpora import MmCorpus
+		directory = self.corpus_directory or CORPUS_DIRECTORY
+		os.makedirs(directory, exist_ok=True)
+		path = os.path.join(directory, "corpus-{}.mm".format(self.fingerprint()))
+		if not os.path.exists(path):
+			temporary_path = "{}.{}".format(path, uuid.uuid4().hex)
+			MmCorpus.serialize(temporary_path, self.stream_bow(), id2word=self.dictionary)
+			os.replace(temporary_path + ".index", path + ".index")
+			os.replace(temporary_path, path)
+			evict_corpora(directory, path)
+		else:
+			# the modification time of a file records when it was last used
+			os.utime(path)
+		return path
+
+	# compute the bag of words of one document at a time from the tokens
+	def stream_bow(self):
+		for i in range(len(self.tokens)):
+			ids, counts = np.unique(self.tokens.ids[self.tokens.offsets[i]:self.tokens.offsets[i+1]], 
+				return_counts=True)
+			yield list(zip(ids.tolist(), counts.tolist()))
+
+	def fingerprint(self):
+		digest = hashlib.sha1()
+		digest.update(self.tokens.ids.tobytes())
+		digest.update(self.tokens.offsets.tobytes())
+		if self.hashed_vocabulary is None:
+			digest.update("\n".join(self.tokens.types).encode())
+		else:
+			digest.update(str(self.hashed_vocabulary).encode())
+		return digest.hexdigest()
+
+	def number_of_documents(self):
+		return len(self.documents)
+
+	# the tokens are replaced, not changed, whenever the bag-of-words corpus changes,
+	# so they identify it for what is computed from it
+	def bow_key(self):
+		return self.tokens
 
 	def get_document_bow(self, document):
 		document_tokens = self.preprocess_document(document)
 		return self.dictionary.doc2bow(document_tokens)
 
 	def average_document_length(self):
-		return np.mean(map(len, self.tokens))
+		return np.mean(self.tokens.lengths())
+
+"""
+What fitting a topic model needs of a corpus, for worker processes: the bag-of-words
+corpus is serialized, and streamed from the file by each worker, so that only the
+dictionary and a few statistics are pickled, and the workers share the pages of the
+file in memory instead of each holding a copy of the corpus. The file is not 
+evicted while the serialized corpus is in use.
+"""
+class SerializedCorpus:
+	open_corpora = weakref.WeakSet()
+
+	def __init__(self, corpus):
+		SerializedCorpus.open_corpora.add(self)
+		self.path = corpus.bow_file()
+		self.dictionary = corpus.dictionary
+		self.documents = corpus.number_of_documents()
+		self.average_length = corpus.average_document_length()
+
+	def bow(self):
+		from gensim.corpora import MmCorpus
+		return MmCorpus(self.path)
+
+	def number_of_documents(self):
+		return self.documents
+
+	def bow_key(self):
+		return self.path
+
+	def average_document_length(self):
+		return self.average_length
+
+CHUNK_SIZE = 10000
+WATCH_INTERVAL = 10	# seconds
+WATCH_FILE_TYPES = (".csv", ".parquet", ".arrow", ".feather")
+TRAINING_ENGINES = ["serial", "multicore"]
 
 """
 Topic model of a corpus.
 """
 class TopicModel:
 	def gensim_version(self):
-		return gs.__version__
+		# read from the package metadata, so that gensim is not imported to show it
+		from importlib.metadata import version
+		return version("gensim")
 
-	def load_corpus(self, url, stopwords, multiwords):
+	# with streaming, the corpus is read and preprocessed in chunks, and the contents
+	# of the documents are not kept in memory; a serialized corpus is streamed from 
+	# disk for training and inference; with a hashed vocabulary, words are hashed to 
+	# the given number of ids
+	def load_corpus(self, url, stopwords, multiwords, number_of_workers=1, token_cache=None,
+			streaming=False, chunk_size=CHUNK_SIZE, serialized=False, hashed_vocabulary=None, phrases=False):
 		if url is not None:
 			url.seek(0)	 # move read head back to the start (StringIO behaves like a file)
-			documents = pd.read_csv(url)
+			if streaming:
+				chunks = self.read_chunks(url, chunk_size)
+				first_chunk = next(chunks, None)
+				if first_chunk is None or 'name' not in first_chunk or 'content' not in first_chunk:
+					return None
+				corpus = Corpus(pd.DataFrame(), SpillFile())
+				if hashed_vocabulary is not None:
+					corpus.use_hashed_vocabulary(hashed_vocabulary)
+				corpus.preprocess_chunks(itertools.chain([first_chunk], chunks), stopwords, multiwords, 
+					number_of_workers, token_cache, phrases)
+				if serialized:
+					corpus.serialize()
+				return corpus
+			documents = self.read_documents(url)
 			if ('name' not in documents or 'content' not in documents):
 				return None
 			corpus = Corpus(documents)
-			corpus.preprocess(stopwords, multiwords)
+			if hashed_vocabulary is not None:
+				corpus.use_hashed_vocabulary(hashed_vocabulary)
+			corpus.preprocess(stopwords, multiwords, number_of_workers, token_cache, phrases)
+			if serialized:
+				corpus.serialize()
 			return corpus
 		else:
 			return None
 
+	# corpora can be CSV, Parquet, or Arrow files; the latter two require pyarrow
+	def file_format(self, url):
+		magic = url.read(6)
+		url.seek(0)
+		if magic[:4] == b"PAR1":
+			return "parquet"
+		elif magic == b"ARROW1":
+			return "arrow"
+		return "csv"
+
+	def read_documents(self, url):
+		file_format = self.file_format(url)
+		if file_format == "parquet":
+			return pd.read_parquet(url)
+		elif file_format == "arrow":
+			import pyarrow as pa
+			return pa.ipc.open_file(url).read_pandas()
+		return pd.read_csv(url)
+
+	def read_chunks(self, url, chunk_size):
+		file_format = self.file_format(url)
+		if file_format == "parquet":
+			import pyarrow.parquet as pq
+			for batch in pq.ParquetFile(url).iter_batches(batch_size=chunk_size):
+				yield batch.to_pandas()
+		elif file_format == "arrow":
+			import pyarrow as pa
+			reader = pa.ipc.open_file(url)
+			for i in range(reader.num_record_batches):
+				yield reader.get_batch(i).to_pandas()
+		else:
+			for chunk in pd.read_csv(url, chunksize=chunk_size):
+				yield chunk
+
+	# the multicore engine trains with LdaMulticore, which spreads the chunks of each 
+	# pass over number_of_workers processes; it only trains faster with at least as 
+	# many chunks as workers; the random seed sets the initial topics, but the model
+	# is updated with the chunks in the order the workers finish them, so the same
+	# seed does not reproduce the same model exactly
 	def fit(self, corpus, number_of_topics, number_of_iterations=50, number_of_passes=1,
-			number_of_chunks=1, random_seed=None, alpha="symmetric"):
+			number_of_chunks=1, random_seed=None, alpha="symmetric", engine="serial", number_of_workers=1):
 		if alpha == "talley":
 			alpha = np.array([self.alpha(corpus, number_of_topics)] * number_of_topics)
+		from gensim import models
 		# Added random_state for reproducibility (the default is to choose a random seed)
+		if engine == "multicore":
+			return LDA(models.LdaMulticore(corpus.bow(), number_of_topics, corpus.dictionary,
+				workers=number_of_workers, iterations=number_of_iterations, passes=number_of_passes, 
+				random_state=random_seed, chunksize=self.chunksize(corpus, number_of_chunks), alpha=alpha))
+		if engine != "serial":
+			raise ValueError("unknown training engine: {}".format(engine))
 		return LDA(models.LdaModel(corpus.bow(), number_of_topics, corpus.dictionary,
 			iterations=number_of_iterations, passes=number_of_passes, random_state=random_seed,
 			chunksize=self.chunksize(corpus, number_of_chunks), alpha=alpha))
 
+	# fold new documents into a corpus, and update a topic model fitted on it with 
+	# them, instead of fitting it again; returns the rows of the new documents in 
+	# the document-topic matrix, as the rows of the other documents are not updated
+	def update(self, model, corpus, documents, number_of_workers=1, token_cache=None):
+		first_document = corpus.append(documents, number_of_workers, token_cache)
+		model.update(corpus, first_document)
+		return model.document_topic_matrix(corpus, first_document, number_of_workers)
+
+	# watch a directory for new files of documents, and fold each into the corpus and
+	# the model; the files already in the directory, or in seen, are not folded in, 
+	# and files are only read once they have not been modified for an interval, so 
+	# that they are not read while they are still being written; callback is called 
+	# with the name of each file folded in, and the rows of its documents
+	def watch(self, directory, model, corpus, callback=None, interval=WATCH_INTERVAL, seen=None,
+			number_of_workers=1, token_cache=None):
+		seen = set(os.listdir(directory)) if seen is None else set(seen)
+		while True:
+			for name in sorted(set(os.listdir(directory)) - seen):
+				path = os.path.join(directory, name)
+				if not name.endswith(WATCH_FILE_TYPES) or time.time() - os.path.getmtime(path) < interval:
+					continue
+				seen.add(name)
+				with open(path, 'rb') as file:
+					documents = self.read_documents(file)
+				if 'name' not in documents or 'content' not in documents:
+					continue
+				dtm = self.update(model, corpus, documents, number_of_workers, token_cache)
+				if callback is not None:
+					callback(name, dtm)
+			time.sleep(interval)
+
+	# LdaModel keeps the topic-word statistics, their expectation, and the statistics
+	# of the current update, each a float32 matrix of topics by words; with the 
+	# multicore engine, each worker keeps its own copy of these
+	def estimated_model_memory(self, corpus, number_of_topics, engine="serial", number_of_workers=1):
+		copies = 1 + number_of_workers if engine == "multicore" else 1
+		return 3 * copies * number_of_topics * corpus.vocabulary_size() * np.dtype(np.float32).itemsize
+
 	def alpha(self, corpus, number_of_topics):
 		return 0.05 * corpus.average_document_length() / number_of_topics
 
 	def chunksize(self, corpus, number_of_chunks):
-		return math.ceil(len(corpus.documents) / number_of_chunks)
+		return math.ceil(corpus.number_of_documents() / number_of_chunks)
+
+INFERENCE_CHUNK_SIZE = 2000
+
+# the topic weights of a chunk of documents, inferred in one E-step; as with
+# get_document_topics, the weights of a document are normalized, and weights
+# below the minimum probability of the model are left out (set to 0)
+def infer_topics(lda, document_bows):
+	gamma, _ = lda.inference(document_bows)
+	# gensim sums the weights of a document one by one, as cumsum does
+	weights = (gamma / gamma.cumsum(axis=1)[:, -1:]).astype(np.float32, copy=False)
+	weights[weights < max(lda.minimum_probability, 1e-8)] = 0
+	return weights
+
+# the model that a worker process infers topics with; it is sent to each worker once, 
+# when the worker starts, and not with each chunk, as it is much larger than a chunk
+worker_lda, worker_random_state = None, None
+
+def set_worker_lda(lda):
+	global worker_lda, worker_random_state
+	worker_lda, worker_random_state = lda, lda.random_state.get_state()
+
+# each chunk is inferred from the random state the model was sent with, so that the
+# weights do not depend on which worker infers which chunks
+def infer_worker_topics(document_bows):
+	worker_lda.random_state.set_state(worker_random_state)
+	return infer_topics(worker_lda, document_bows)
+
+# document-topic matrices are either dense arrays, or sparse (CSR) matrices, which
+# only hold the weights that are not left out by the minimum probability of a model;
+# the following work on either
+
+def read_only(dtm):
+	from scipy.sparse import issparse
+	for array in ([dtm.data, dtm.indices, dtm.indptr] if issparse(dtm) else [dtm]):
+		array.flags.writeable = False
+	return dtm
+
+# the weights of a topic for all documents, as a dense array
+def topic_column(dtm, topic):
+	from scipy.sparse import issparse
+	return dtm[:, [topic]].toarray().ravel() if issparse(dtm) else dtm[:, topic]
+
+def topic_totals(dtm):
+	return np.asarray(dtm.sum(axis=0, dtype=np.float64)).ravel()
+
+# the number of documents in which each pair of topics i < j co-occurs, that is, in 
+# which both topics have a weight of at least min_weight; a sparse matrix is only 
+# made dense a chunk of documents at a time
+def topic_co_occurrences(dtm, min_weight, chunk_size=INFERENCE_CHUNK_SIZE):
+	from scipy.sparse import issparse
+	co_occurrences = np.zeros((dtm.shape[1], dtm.shape[1]))
+	for start in range(0, dtm.shape[0], chunk_size):
+		chunk = dtm[start:start + chunk_size]
+		present = ((chunk.toarray() if issparse(chunk) else chunk) >= min_weight).astype(np.float64)
+		co_occurrences += present.T @ present
+	return np.triu(co_occurrences, 1)
+
+# the sum of the weights of each topic over the documents of each group (such as 
+# the documents of a year), with a row for each group, in sorted order, as groupby
+def group_topic_weights(dtm, groups):
+	from scipy.sparse import csr_matrix, issparse
+	codes, labels = pd.factorize(pd.Series(groups), sort=True)
+	documents = np.flatnonzero(codes >= 0)
+	membership = csr_matrix((np.ones(len(documents), dtype=np.float32), (codes[documents], documents)), 
+		shape=(len(labels), dtm.shape[0]))
+	weights = membership @ dtm
+	return pd.DataFrame(weights.toarray() if issparse(weights) else weights, index=labels)
+
+# the number of top words that each pair of topics of two models share among their 
+# top k words, for each k from 0 to n - 1 (topics by other topics by n), given the ids
+# of the top n words of each of their topics, in order, and with leading axes, such as
+# runs, for each pair of models along them; a word is among the top k words of both
+# topics if its positions in both topics are less than k, so only the words that occur
+# in both topics are counted, which are found by sorting the words of the other topics
+def shared_top_words(top_words, other_top_words):
+	shape = np.broadcast_shapes(top_words.shape[:-2], other_top_words.shape[:-2])
+	number_of_topics, n = top_words.shape[-2:]
+	number_of_other_topics = other_top_words.shape[-2]
+	top_words = np.broadcast_to(top_words, shape + top_words.shape[-2:]).reshape(-1, number_of_topics, n)
+	other_top_words = np.broadcast_to(other_top_words, shape + other_top_words.shape[-2:]).reshape(
+		-1, number_of_other_topics, n)
+	number_of_models = len(top_words)
+	# the words of different models along the leading axes get different keys
+	number_of_words = int(max(top_words.max(initial=0), other_top_words.max(initial=0))) + 1
+	models = np.arange(number_of_models, dtype=np.int64)[:, None, None] * number_of_words
+	keys, other_keys = (models + top_words).ravel(), (models + other_top_words).ravel()
+	order = np.argsort(other_keys, kind='stable')
+	first = np.searchsorted(other_keys[order], keys, side='left')
+	counts = np.searchsorted(other_keys[order], keys, side='right') - first
+	# the pairs of positions (in the flattened arrays) of the words that both topics share
+	positions = np.repeat(np.arange(len(keys)), counts)
+	other_positions = order[np.repeat(first, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)]
+	topic_pairs = ((positions // n) * number_of_other_topics + (other_positions // n) % number_of_other_topics)
+	shared = np.bincount(topic_pairs * n + np.maximum(positions % n, other_positions % n), 
+		minlength=number_of_models * number_of_topics * number_of_other_topics * n)
+	shared = shared.reshape(number_of_models, number_of_topics, number_of_other_topics, n)
+	# a word at position m is among the top k words of both topics for each k above m
+	shared = np.concatenate([np.zeros_like(shared[..., :1]), np.cumsum(shared[..., :-1], axis=-1)], axis=-1)
+	return shared.reshape(shape + (number_of_topics, number_of_other_topics, n))
+
+# the average Jaccard distance of Greene (2014) between the topics of two models, given 
+# the ids of the top n words of each of their topics, in order: as LdaModel.diff does, 
+# the distances between the top k words of the topics are normalized by their maximum 
+# for each k from 0 to n - 1, and then averaged; with leading axes, such as runs, the 
+# distances are computed for each pair of models along them
+def average_jaccard_distance(top_words, other_top_words):
+	n = top_words.shape[-1]
+	shared = shared_top_words(top_words, other_top_words)
+	distances = []
+	for k in range(n):
+		# the distance between two empty sets is 1, as in gensim
+		distance = 1. - shared[..., k] / (2. * k - shared[..., k]) if k > 0 else np.ones(shared.shape[:-1])
+		maximum = np.max(distance, axis=(-2, -1), keepdims=True)
+		distances.append(np.where(np.abs(maximum) > 1e-8, distance / np.where(maximum == 0, 1, maximum), distance))
+	return sum(distances) / n
 
 class LDA:
 	def __init__(self, lda):
 		self.lda = lda
+		self.cached_dtm = None
+
+	# the cached document-topic matrix is not pickled with the model
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state['cached_dtm'] = None
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self.cached_dtm = None
 
 	def number_of_topics(self):
 		return self.lda.num_topics
@@ -130,9 +1293,22 @@ class LDA:
 			num_words=number_of_words, formatted=False)
 
 	def get_document_topics(self, document_bow):
-		return self.lda.get_document_topics(document_bow)
+		return self.lda.get_document_topics(self.known_words(document_bow))
+
+	# gensim cannot add words to a fitted model, so the words added to the corpus 
+	# after the model was fitted are left out when it infers or updates topics
+	def known_words(self, document_bow):
+		return [(id, count) for id, count in document_bow if id < self.lda.num_terms]
+
+	# update the model online with the documents from first_document on, as when
+	# they are appended to the corpus the model was fitted on
+	def update(self, corpus, first_document):
+		self.lda.update([self.known_words(document_bow) 
+			for document_bow in BowCorpus(corpus.bow_rows(first_document))])
+		self.cached_dtm = None
 
 	def coherence(self, corpus):
+		from gensim.models.coherencemodel import CoherenceModel
 		coherence_model = CoherenceModel(model=self.lda, texts=corpus.tokens, 
 			dictionary=corpus.dictionary, coherence='c_uci')
 		return coherence_model.get_coherence()
@@ -140,18 +1316,99 @@ class LDA:
 	# return a difference matrix between two topic models
 	# computes the average jaccard distance as defined by Greene (2014)
 	def difference(self, other, n=10):
-		return sum([self.jaccard(other, k) for k in range(n)]) / n
+		return average_jaccard_distance(self.top_word_ids(n), other.top_word_ids(n))
+
+	def top_word_ids(self, n=10):
+		return self.top_words(n)[0]
+
+	# the ids and weights of the top n words of each topic (topics by words), from the
+	# topic-word matrix at once, and ordered by weight as show_topic orders them (but 
+	# for ties, which show_topic may break differently for fewer words)
+	def top_words(self, n=10):
+		topics = self.lda.get_topics()
+		topics = -(topics / topics.sum(axis=1, keepdims=True))
+		if n >= topics.shape[1]:
+			top_words = np.argsort(topics, axis=1)[:, :n]
+		else:
+			top_words = np.argpartition(topics, n, axis=1)[:, :n]
+			top_words = np.take_along_axis(top_words, 
+				np.argsort(np.take_along_axis(topics, top_words, axis=1), axis=1), axis=1)
+		return top_words, -np.take_along_axis(topics, top_words, axis=1)
 
 	def jaccard(self, other, k):
 		diff, _ = self.lda.diff(other.lda, distance='jaccard', num_words=k)
 		return diff
 
-	def document_topic_matrix(self, corpus):
-		dtm = []
-		for document_bow in corpus.bow():
-			dtm.append(self.topics_sparse_to_full(self.get_document_topics(document_bow)))
-			tcid = corpus.dictionary.id2token
-		return pd.DataFrame(dtm)
+	# the document-topic matrix as a frame, which is dense even if the matrix is kept sparse;
+	# from first_document on, the rows are inferred, such as those of appended documents
+	def document_topic_matrix(self, corpus, first_document=0, number_of_workers=1, sparse=False):
+		dtm = (self.document_topics(corpus, number_of_workers, sparse) if first_document == 0 
+			else self.infer_document_topics(corpus, first_document, number_of_workers, sparse))
+		if sparse:
+			dtm = dtm.toarray()
+		return pd.DataFrame(dtm, index=pd.RangeIndex(first_document, first_document + len(dtm)), copy=False)
+
+	# the topics of the documents of a corpus are inferred once, and kept until the 
+	# model is updated or the bag-of-words corpus changes; as the matrix is shared
+	# by all who ask for it, it is read-only
+	def document_topics(self, corpus, number_of_workers=1, sparse=False):
+		from scipy.sparse import csr_matrix, issparse
+		if self.cached_dtm is None or self.cached_dtm[0] is not corpus.bow_key():
+			dtm = self.infer_document_topics(corpus, 0, number_of_workers, sparse)
+		elif issparse(self.cached_dtm[1]) != sparse:
+			# the weights are the same either way, so they are converted, not inferred again
+			dtm = csr_matrix(self.cached_dtm[1]) if sparse else self.cached_dtm[1].toarray()
+		else:
+			return self.cached_dtm[1]
+		self.cached_dtm = (corpus.bow_key(), read_only(dtm))
+		return dtm
+
+	# infer the topics of the documents from first_document on; a sparse matrix 
+	# (CSR) only holds the weights that are not left out by the minimum probability;
+	# dense weights are written to out if it is given, such as part of a larger array
+	def infer_document_topics(self, corpus, first_document=0, number_of_workers=1, sparse=False, out=None):
+		from scipy.sparse import csr_matrix, vstack
+		document_bows = corpus.bow() if first_document == 0 else BowCorpus(corpus.bow_rows(first_document))
+		if sparse:
+			chunks = sorted(((start, csr_matrix(weights)) for start, weights 
+				in self.inferred_chunks(document_bows, number_of_workers)), key=lambda chunk: chunk[0])
+			if not chunks:
+				return csr_matrix((0, self.number_of_topics()), dtype=np.float32)
+			return vstack([weights for start, weights in chunks], format='csr', dtype=np.float32)
+		dtm = np.zeros((len(document_bows), self.number_of_topics()), dtype=np.float32) if out is None else out
+		for start, weights in self.inferred_chunks(document_bows, number_of_workers):
+			dtm[start:start + len(weights)] = weights
+		return dtm
+
+	# the topic weights of the documents a chunk at a time; with more than one worker,
+	# the chunks are inferred in parallel, each by a copy of the model, and yielded as 
+	# they complete; the copies start from the same random state instead of continuing
+	# it, so the weights can differ slightly from those inferred serially
+	def inferred_chunks(self, document_bows, number_of_workers=1):
+		if number_of_workers == 1:
+			for start, chunk in self.document_chunks(document_bows):
+				yield start, infer_topics(self.lda, chunk)
+			return
+		with ProcessPoolExecutor(max_workers=number_of_workers, initializer=set_worker_lda, 
+				initargs=(self.lda,)) as executor:
+			# a few chunks per worker are in flight, so the corpus is not copied all at once
+			futures = {}
+			for start, chunk in self.document_chunks(document_bows):
+				if len(futures) == 2 * number_of_workers:
+					done, _ = wait(futures, return_when=FIRST_COMPLETED)
+					for future in done:
+						yield futures.pop(future), future.result()
+				futures[executor.submit(infer_worker_topics, chunk)] = start
+			for future in as_completed(futures):
+				yield futures[future], future.result()
+
+	def document_chunks(self, document_bows, chunk_size=INFERENCE_CHUNK_SIZE):
+		document_bows = iter(document_bows)
+		for start in itertools.count(0, chunk_size):
+			chunk = [self.known_words(document_bow) for document_bow in itertools.islice(document_bows, chunk_size)]
+			if not chunk:
+				return
+			yield start, chunk
 
 	def topics_sparse_to_full(self, topics):
 		topics_full = [0] * self.number_of_topics()  # pythonic way of creating a list of zeros
@@ -173,88 +1430,353 @@ class LDA:
 		tcom = self.topic_co_occurrence_matrix(dtm, min_weight)
 		return self.tcom_to_sentences(tcom)
 
+MODEL_CACHE_DIRECTORY = "cache/models"
+MODEL_CACHE_SIZE = 2 ** 30	# bytes
+
+# the distances between the topics of a run and those of each run from first_run on, 
+# given the ids of the top words of the topics of all runs, and the assignments of the
+# topics of the other runs to those of the run that minimize the total average Jaccard 
+# distance between matching topics, found with the Hungarian method
+def run_alignments_from(top_words, run, first_run):
+	from scipy.optimize import linear_sum_assignment
+	distances = average_jaccard_distance(top_words[run][None], top_words[first_run:])
+	return distances, np.array([linear_sum_assignment(distance)[1] for distance in distances])
+
+# align all pairs of runs: the distances between their topics (runs by runs by topics
+# by topics), and the assignments of the topics of each run to those of each other run 
+# (runs by runs by topics); the distance is symmetric, so each pair is only aligned 
+# once; given the distances and assignments of the first runs, only the pairs of the
+# other runs are aligned
+def run_alignments(top_words, distances=None, assignments=None):
+	number_of_runs, number_of_topics = top_words.shape[:2]
+	aligned_runs = 0 if distances is None else len(distances)
+	if aligned_runs == number_of_runs:
+		return distances, assignments
+	if distances is not None:
+		distances, assignments = (np.pad(distances, [(0, number_of_runs - aligned_runs)] * 2 + [(0, 0)] * 2),
+			np.pad(assignments, [(0, number_of_runs - aligned_runs)] * 2 + [(0, 0)]))
+	else:
+		distances = np.zeros((number_of_runs, number_of_runs, number_of_topics, number_of_topics))
+		assignments = np.zeros((number_of_runs, number_of_runs, number_of_topics), dtype=np.int64)
+	for run in range(number_of_runs):
+		# each run is aligned with the runs from the first run that was not aligned, or from itself
+		first_run = max(run, aligned_runs)
+		run_distances, run_assignments = run_alignments_from(top_words, run, first_run)
+		distances[run, first_run:] = run_distances
+		distances[first_run:, run] = run_distances.transpose(0, 2, 1)
+		assignments[run, first_run:] = run_assignments
+		# the inverse of an assignment assigns the topics the other way
+		assignments[first_run:, run] = np.argsort(run_assignments, axis=1)
+		assignments[run, run] = np.arange(number_of_topics)
+	return distances, assignments
+
+# the run with the least total distance between its topics and their matching topics
+# in the other runs, as a reference for a consensus ordering of the topics
+def consensus_run(distances, assignments):
+	matching_distances = np.take_along_axis(distances, assignments[..., None], axis=3)[..., 0]
+	return int(np.argmin(matching_distances.sum(axis=(1, 2))))
+
+# the stability of each topic of the reference run across the other runs: the average
+# similarity (1 - distance) of the topic with its matching topics in the other runs, 
+# and the share of pairs of other runs in which these matching topics match each other
+def topic_stability(distances, assignments, reference):
+	number_of_runs, number_of_topics = assignments.shape[1:]
+	others = [run for run in range(number_of_runs) if run != reference]
+	if not others:
+		return np.ones(number_of_topics), np.ones(number_of_topics)
+	matches = assignments[reference, others]
+	matching_distances = np.take_along_axis(distances[reference, others], matches[..., None], axis=2)[..., 0]
+	stability = 1 - matching_distances.mean(axis=0)
+	if len(others) < 2:
+		return stability, np.ones(number_of_topics)
+	# the topics of the second run of each pair that the matching topics of the first run are assigned to
+	assigned = np.take_along_axis(assignments[np.ix_(others, others)], 
+		np.broadcast_to(matches[:, None, :], (len(others), len(others), number_of_topics)), axis=2)
+	pairs = ~np.eye(len(others), dtype=bool)
+	agreement = (assigned == matches[None, :, :])[pairs].mean(axis=0)
+	return stability, agreement
+
+"""
+On-disk cache of fitted topic models, each pickled to a file named after a hash
+of the corpus and of the parameters and seed of the fit. When the total size of 
+the files exceeds max_size, the least recently used models are evicted.
+"""
+class ModelCache:
+	def __init__(self, directory=MODEL_CACHE_DIRECTORY, max_size=MODEL_CACHE_SIZE):
+		self.directory = directory
+		self.max_size = max_size
+		os.makedirs(directory, exist_ok=True)
+
+	def key(self, corpus_fingerprint, number_of_topics, options):
+		return hashlib.sha1("{}\0{}\0{}".format(corpus_fingerprint, number_of_topics, 
+			sorted(options.items())).encode()).hexdigest()
+
+	def path(self, key):
+		return os.path.join(self.directory, "model-{}.pkl".format(key))
+
+	def get(self, key):
+		path = self.path(key)
+		try:
+			with open(path, 'rb') as file:
+				model = pickle.load(file)
+		except (OSError, EOFError, pickle.UnpicklingError):
+			return None
+		# the modification time of a file records when it was last used
+		os.utime(path)
+		return model
+
+	def put(self, key, model):
+		path = self.path(key)
+		temporary_path = "{}.{}".format(path, uuid.uuid4().hex)
+		with open(temporary_path, 'wb') as file:
+			pickle.dump(model, file, protocol=pickle.HIGHEST_PROTOCOL)
+		os.replace(temporary_path, path)
+		self.evict()
+
+	def evict(self):
+		evict_least_recently_used(self.directory, "model-", ".pkl", self.max_size)
+
+# the seed of each run is derived from the seed of the alignment and the index of
+# the run, so that the runs differ, but each run can be fitted again, or reused
+def run_seed(random_seed, run):
+	return int(np.random.SeedSequence(random_seed, spawn_key=(run,)).generate_state(1)[0])
+
+NUMBER_OF_KEYWORDS = 10
+
+"""
+The frames of the keywords, or their weights, of the topics of an alignment, with a 
+row for each keyword and a column for each run, which are made from the array of the 
+keywords (runs by topics by keywords) when they are asked for.
+"""
+class TopicFrames:
+	def __init__(self, values):
+		self.values = values
+
+	def __len__(self):
+		return self.values.shape[1]
+
+	def __getitem__(self, topic):
+		return pd.DataFrame(self.values[:, topic].T)
+
+	def __iter__(self):
+		for topic in range(len(self)):
+			yield self[topic]
+
+"""
+The frames of the weights of the topics of an alignment for the documents, with a row
+for each document and a column for each run. The frames are views of the array of the
+weights (runs by documents by topics), or if the weights are sparse, made from the 
+sparse matrices of the runs (documents by topics) when they are asked for.
+"""
+class DocumentFrames:
+	def __init__(self, weights, number_of_topics):
+		self.weights = weights
+		self.number_of_topics = number_of_topics
+
+	def __len__(self):
+		return self.number_of_topics
+
+	def __getitem__(self, topic):
+		if isinstance(self.weights, list):
+			return pd.DataFrame({run: pd.arrays.SparseArray.from_spmatrix(weights[:, [topic]]) 
+				for run, weights in enumerate(self.weights)})
+		return pd.DataFrame(self.weights[:, :, topic].T, copy=False)
+
+	def __iter__(self):
+		for topic in range(len(self)):
+			yield self[topic]
+
 class TopicAlignment:
-	def __init__(self, topic_model, corpus, number_of_topics, number_of_chunks, number_of_runs, random_seed=None):
+	# without a random seed, one is chosen at random for the alignment, from which the
+	# seeds of the runs are derived as well; the runs are only cached with a given seed
+	def __init__(self, topic_model, corpus, number_of_topics, number_of_chunks, number_of_runs, random_seed=None,
+			engine="serial", number_of_workers=1, number_of_processes=1, model_cache=None, sparse=False,
+			consensus=False, memory_map=False):
 		self.topic_model = topic_model
 		self.corpus = corpus
 		self.number_of_topics = number_of_topics
 		self.number_of_chunks = number_of_chunks
 		self.number_of_runs = number_of_runs
-		self.random_seed = random_seed
+		self.random_seed = random_seed if random_seed is not None else int(np.random.SeedSequence().generate_state(1)[0])
+		self.model_cache = model_cache if random_seed is not None else None
+		self.engine = engine
+		self.number_of_workers = number_of_workers
+		self.number_of_processes = number_of_processes
+		self.sparse = sparse
+		self.consensus = consensus
+		self.memory_map = memory_map
+		self.corpus_fingerprint = None
 
 	def fit(self, progress_update):
 		# experimental: remember the computed LDA models
 		# don't store the computed LDA models; in this way, they don't get 
 		# included in the hash streamlit uses to cache results
-		self.lda_models = self.lda_model_runs(progress_update)
-		# determine the matching topics across the different runs
-		self.matches = self.matches(self.lda_models)
-		# find the top topic keywords for each topic and each run
-		self.topics = self.topics(self.lda_models)
-		# collect the keywords and associated weights for each topic across all topic models
-		self.keywords, self.weights = self.keywords_with_weights(self.lda_models)
-		# find the topics for each document
-		self.dtm, self.documents = self.documents(self.lda_models)
-
-	# create a group of topic models with the same number of topics
-	def lda_model_runs(self, progress_update):
-		lda_models = []
-		for run in range(self.number_of_runs):
-			lda_models.append(self.topic_model.fit(self.corpus, self.number_of_topics, 
-				number_of_chunks=self.number_of_chunks, random_seed=self.random_seed))
+		self.lda_models, self.top_words, self.top_weights = [], [], []
+		self.reference = 0
+		# the weights of the topics of the runs for the documents, and for each run, the 
+		# topics of the run in the order they are stored in
+		self.document_weights = [] if self.sparse else None
+		self.document_matches = []
+		# the distances and assignments between the topics of all pairs of runs
+		self.distances, self.assignments = None, None
+		self.add_runs(self.number_of_runs, progress_update)
+
+	# change the number of runs; only the added runs are fitted, and the other runs 
+	# keep their columns in the frames of the alignment, unless the reference run changes
+	def set_number_of_runs(self, number_of_runs, progress_update):
+		if number_of_runs < len(self.lda_models):
+			self.drop_runs(number_of_runs)
+		elif number_of_runs > len(self.lda_models):
+			self.add_runs(number_of_runs, progress_update)
+
+	def add_runs(self, number_of_runs, progress_update):
+		runs = range(len(self.lda_models), number_of_runs)
+		self.number_of_runs = number_of_runs
+		if not self.sparse:
+			self.resize_document_weights(number_of_runs)
+		for run, lda_model in zip(runs, self.lda_model_runs(runs, progress_update)):
+			self.lda_models.append(lda_model)
+			top_words, top_weights = lda_model.top_words(NUMBER_OF_KEYWORDS)
+			self.top_words.append(top_words)
+			self.top_weights.append(top_weights)
+			# find the topics for each document, which are stored in the order of the run
+			# until it is aligned; they are not cached by the model, as they are stored here
+			if self.sparse:
+				self.document_weights.append(lda_model.infer_document_topics(self.corpus, 0, 
+					self.number_of_processes, sparse=True))
+			else:
+				lda_model.infer_document_topics(self.corpus, 0, self.number_of_processes, out=self.document_weights[run])
+			self.document_matches.append(np.arange(self.number_of_topics))
+		self.align_runs(runs)
+
+	def drop_runs(self, number_of_runs):
+		self.number_of_runs = number_of_runs
+		self.distances = self.distances[:number_of_runs, :number_of_runs].copy()
+		self.assignments = self.assignments[:number_of_runs, :number_of_runs].copy()
+		del self.lda_models[number_of_runs:]
+		del self.top_words[number_of_runs:]
+		del self.top_weights[number_of_runs:]
+		del self.document_matches[number_of_runs:]
+		if self.sparse:
+			del self.document_weights[number_of_runs:]
+		else:
+			self.resize_document_weights(number_of_runs)
+		self.align_runs([])
+
+	# the weights of the topics of the runs for the documents are kept in one array 
+	# (runs by documents by topics), in a memory-mapped file with memory_map; when runs
+	# are added or dropped, the array is allocated again, and the weights of the runs 
+	# that are kept copied, so that the old array is freed; the file is removed once 
+	# its array (and every view of it, such as a frame) is no longer used
+	def resize_document_weights(self, number_of_runs):
+		shape = (number_of_runs, self.corpus.number_of_documents(), self.number_of_topics)
+		if self.memory_map:
+			os.makedirs(SPILL_DIRECTORY, exist_ok=True)
+			path = os.path.join(SPILL_DIRECTORY, "alignment-{}.npy".format(uuid.uuid4().hex))
+			document_weights = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=shape)
+			weakref.finalize(document_weights, os.remove, path)
+		else:
+			document_weights = np.zeros(shape, dtype=np.float32)
+		if self.document_weights is not None:
+			kept_runs = min(len(self.document_weights), number_of_runs)
+			document_weights[:kept_runs] = self.document_weights[:kept_runs]
+		self.document_weights = document_weights
+
+	# align the given runs with all runs, and then with the reference run, which is the
+	# first run, or with consensus, the run closest to the other runs; if the reference 
+	# run changes, all runs are aligned with the new reference run
+	def align_runs(self, runs):
+		self.distances, self.assignments = run_alignments(np.array(self.top_words), self.distances, 
+			self.assignments)
+		reference = consensus_run(self.distances, self.assignments) if self.consensus else 0
+		if reference != self.reference:
+			self.reference, runs = reference, range(self.number_of_runs)
+		self.align_keywords()
+		for run in runs:
+			self.align_run(run)
+		self.documents = DocumentFrames(self.document_weights, self.number_of_topics)
+		self.stability, self.agreement = topic_stability(self.distances, self.assignments, self.reference)
+
+	# the top words of the topics of each run (runs by topics by words) are ordered by the
+	# topics they match in the reference run; their frames are made when they are needed
+	def align_keywords(self):
+		top_words = np.array(self.top_words)
+		ids, inverse = np.unique(top_words, return_inverse=True)
+		id2word = self.lda_models[0].lda.id2word
+		words = np.array([id2word[id] for id in ids], dtype=object)[inverse.reshape(top_words.shape)]
+		# the topics of each run, with their top words, as they are numbered in the run
+		self.topics = pd.DataFrame([[" ".join(topic_words) for topic_words in run_words] for run_words in words]).T
+		# the topics that match the topics of the reference run
+		matches = self.assignments[self.reference]
+		self.matches = pd.DataFrame(matches.T)
+		self.word_ids = np.take_along_axis(top_words, matches[..., None], axis=1)
+		self.words = np.take_along_axis(words, matches[..., None], axis=1)
+		self.word_weights = np.take_along_axis(np.array(self.top_weights), matches[..., None], axis=1)
+		self.keywords, self.weights = TopicFrames(self.words), TopicFrames(self.word_weights)
+
+	# order the weights of the topics of the run for the documents as the topics they match
+	# in the reference run; they are stored in the order of the topics they matched before
+	# (at first, the order of the run), so they are permuted from that order
+	def align_run(self, run):
+		matches = self.assignments[self.reference, run]
+		order = np.argsort(self.document_matches[run])[matches]
+		if self.sparse:
+			self.document_weights[run] = self.document_weights[run][:, order]
+		elif (order != np.arange(self.number_of_topics)).any():
+			# a chunk of documents at a time, so that the weights of the run are not copied at once
+			weights = self.document_weights[run]
+			for start in range(0, len(weights), INFERENCE_CHUNK_SIZE):
+				weights[start:start + INFERENCE_CHUNK_SIZE] = weights[start:start + INFERENCE_CHUNK_SIZE][:, order]
+		self.document_matches[run] = matches
+
+	# create a group of topic models with the same number of topics; the runs are 
+	# independent, so they are fitted by a pool of number_of_processes processes, 
+	# and progress is reported as they complete, in any order
+	def lda_model_runs(self, runs, progress_update):
+		lda_models = {run: self.cached_run(run) for run in runs}
+		missing_runs = [run for run in runs if lda_models[run] is None]
+		completed = self.number_of_runs - len(missing_runs)
+		for run in range(self.number_of_runs - len(runs), completed):
 			progress_update(run)
-		return lda_models
-
-	# extract the topic words for each topic in all topic models
-	def topics(self, lda_models):
-		return pd.DataFrame([[" ".join([tw[0] for tw in lda_model.lda.show_topic(t, 10)]) 
-			for lda_model in lda_models] for t in range(self.number_of_topics)])
-
-	# compute the average Jaccard distance between the topic models
-	def differences(self, lda_models):
-		return [lda_models[0].difference(lda_models[i]) 
-			for i in range(1, len(lda_models))]
-
-	# fit topics between the first and each of the remaining topic models using
-	# the Hungarian linear assignment method
-	def matches(self, lda_models):
-		diffs = self.differences(lda_models)
-		matches = pd.DataFrame()
-		# first column are the topics of the first topic model
-		matches[0] = range(self.number_of_topics)
-		# minimize the total misalignment between topics
-		for i in range(1, self.number_of_runs):
-			_, cols = linear_sum_assignment(diffs[i-1])
-			# each column contains the topics that align with the topics of the first topic
-			matches[i] = cols
-		return matches
-
-	def keywords_with_weights(self, lda_models):
-		keywords, weights = [], []
-		for topic in range(self.number_of_topics):
-			keywords_for_topic = pd.DataFrame()
-			weights_for_topic = pd.DataFrame()
-			for i in range(self.number_of_runs):
-				keywords_for_topic[i] = [tw[0] for tw 
-					in lda_models[i].lda.show_topic(self.matches[i][topic], 10)]
-				weights_for_topic[i] = [tw[1] for tw 
-					in lda_models[i].lda.show_topic(self.matches[i][topic], 10)]
-			keywords.append(keywords_for_topic)
-			weights.append(weights_for_topic)
-		return keywords, weights
-
-	def documents(self, lda_models):
-		dtm = [lda_models[i].document_topic_matrix(self.corpus)
-			for i in range(self.number_of_runs)]
-		documents = []
-		for topic in range(self.number_of_topics):
-			documents_for_topic = pd.DataFrame()
-			for i in range(self.number_of_runs):
-				documents_for_topic[i] = dtm[i][self.matches[i][topic]]
-			documents.append(documents_for_topic)
-		return dtm, documents
+		if self.number_of_processes <= 1 or len(missing_runs) <= 1:
+			for run in missing_runs:
+				lda_models[run] = self.topic_model.fit(self.corpus, self.number_of_topics, **self.fit_options(run))
+				self.cache_run(run, lda_models[run])
+				progress_update(completed)
+				completed = completed + 1
+			return [lda_models[run] for run in runs]
+		corpus = SerializedCorpus(self.corpus)
+		with ProcessPoolExecutor(max_workers=min(self.number_of_processes, len(missing_runs))) as executor:
+			# only the topic model and the serialized corpus are pickled, not the alignment
+			futures = {executor.submit(self.topic_model.fit, corpus, self.number_of_topics, **self.fit_options(run)): run 
+				for run in missing_runs}
+			for future in as_completed(futures):
+				run = futures[future]
+				lda_models[run] = future.result()
+				self.cache_run(run, lda_models[run])
+				progress_update(completed)
+				completed = completed + 1
+		return [lda_models[run] for run in runs]
+
+	def fit_options(self, run):
+		return dict(number_of_chunks=self.number_of_chunks, random_seed=run_seed(self.random_seed, run), 
+			engine=self.engine, number_of_workers=self.number_of_workers)
 
-# initialize
+	# a fitted run is cached under the corpus, the number of topics, and its options;
+	# the model only depends on the number of workers with the multicore engine
+	def run_key(self, run):
+		if self.corpus_fingerprint is None:
+			self.corpus_fingerprint = self.corpus.fingerprint()
+		options = self.fit_options(run)
+		if options["engine"] != "multicore":
+			del options["number_of_workers"]
+		return self.model_cache.key(self.corpus_fingerprint, self.number_of_topics, options)
 
-nltk.download('wordnet') 
+	def cached_run(self, run):
+		if self.model_cache is None:
+			return None
+		return self.model_cache.get(self.run_key(run))
 
+	def cache_run(self, run, lda_model):
+		if self.model_cache is not None:
+			self.model_cache.put(self.run_key(run), lda_model)
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+import zlib
+
+from gensim.corpora import HashDictionary
+
+"""
+Vocabulary of a fixed number of ids that words are hashed to, as gensim's 
+HashDictionary without debug. To show topics, each id is labeled with one of the
+words hashed to it, chosen by a weighted (Boyer-Moore) majority vote, so the memory
+used does not grow with the number of distinct words. A word that is hashed to an
+id more often than all other words together is its label; otherwise, the label is
+not necessarily the word hashed to the id most often.
+"""
+class HashedVocabulary(HashDictionary):
+	def __init__(self, id_range):
+		# crc32 spreads short words over the ids better than gensim's default adler32
+		HashDictionary.__init__(self, id_range=id_range, myhash=zlib.crc32, debug=False)
+		self.labels, self.votes = {}, {}
+		# coherence looks up the words of top ids, and the ids of those words
+		self.id2token = self.labels
+
+	def add_labels(self, words, ids, counts):
+		for word, id, count in zip(words, ids, counts):
+			if self.labels.get(id) == word:
+				self.votes[id] = self.votes[id] + count
+			elif self.votes.get(id, 0) >= count:
+				self.votes[id] = self.votes[id] - count
+			else:
+				self.votes[id] = count - self.votes.get(id, 0)
+				self.labels[id] = word
+		self.token2id = {word: id for id, word in self.labels.items()}
+
+	def __getitem__(self, id):
+		return self.labels.get(id, "#{}".format(id))
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+
+# fit a topic model on a file of documents, then fold the files of documents that are
+# added to a directory into the corpus and the model as they arrive:
+# python watch-corpus.py documents.csv directory [number of topics]
+
+import sys
+
+from topics import TopicModel
+
+url, directory = sys.argv[1], sys.argv[2]
+number_of_topics = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+topic_model = TopicModel()
+with open(url, 'rb') as file:
+	corpus = topic_model.load_corpus(file, "", "")
+model = topic_model.fit(corpus, number_of_topics)
+
+def show_update(name, document_topic_matrix):
+	print("{}: {} documents added, {} in the corpus".format(name, len(document_topic_matrix), 
+		corpus.number_of_documents()))
+	for topic, words in model.show_topics(number_of_topics, 8):
+		print("  {}: {}".format(topic, " ".join(word for word, probability in words)))
+
+topic_model.watch(directory, model, corpus, show_update)